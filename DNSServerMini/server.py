@@ -1,114 +1,78 @@
-import pickle
-from socket import *
-from response import Response
-import binascii
-from cache import Cache
-from request import Request
+import os
+import sys
 
-from utils import get_name
+# ядро сервера (stages, cache, policy, ...) общее с main.py и лежит уровнем выше
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-QTYPE = {1: 'A', 2: 'NS', 12: 'PTR', 28: 'AAAA'}
+from socket import *
+from conf import Config
+from policy import Blocklist
+from ratelimit import RateLimiter, ALLOW, TRUNCATE
+from wire import truncated
+from querylog import log, querylog
+from special import SpecialZones
+from upstream import UpstreamPool
+from zone import ZoneStore
+from stages import build_pipeline, serve_request, open_cache
+
+MAX_RECORDS = 10000
 
 class Server:
-    def __init__(self, socket):
+    def __init__(self, socket, config, limiter=None):
         self.socket = socket
-        self.cache = Cache()
+        self.config = config
+        self.cache = open_cache(config)
+        self.limiter = limiter
+        self.pipeline = self.build_pipeline()
+
+    def build_pipeline(self):
+        # те же этапы, что и в main.py: разбор -> спецзоны -> блок-лист ->
+        # кэш -> апстрим -> сохранение; попадание в кэш завершает конвейер
+        config = self.config
+        blocklist = Blocklist()
+        if config.blocklist:
+            blocklist.load(config.blocklist)
+        special = None
+        if config.special_zones:
+            special = SpecialZones()
+            if config.hosts:
+                special.load_hosts(config.hosts)
+        resolver = UpstreamPool([config.forwarder_address], config.timeout, config.hedge,
+                                buffer_size=config.buffer_size)
+        return build_pipeline(config, self.cache, ZoneStore(), blocklist, resolver, special=special)
 
     def start(self):
-        while True:
-            try:
-                received, addr = socket.recvfrom(1024)
-                received = binascii.hexlify(received).decode("utf-8")
-                req = Request()
-                response = self.parse_response(req.parse_request(received, self.cache.get_data()), self.cache.get_data())
-                if response is not None:
-                    socket.sendto(binascii.unhexlify(response), addr)
-                print(self.cache.get_data())
-                self.cache.clear_cache()
-                socket.dup()
-            except:
-                print("Exeption")
-                pass
-
-    def extract_name(self, r, ind):
-        link = str(bin(int(r[ind:ind+4], 16)))[2:]
-        link = int(link[2:], 2) * 2
-        res, _ = get_name(r, link)
-        print(res)
-        return res
-
-    def parse_response(self, r, cache):
-        print(r)
-        if r is None:
-            return None
-
-        header = r[0:24]
-        question = r[24:]
-
-        name, offset = get_name(r)
-
-        t = question[offset - 8: offset - 4]
-
-        dot_count = name.count(".")
-        char_count = len(name) - dot_count
-        question_len = char_count * 2 + (dot_count + 2) * 2
-
-        answer = r[24 + question_len + 8:]
-
-        an_count = int(header[12:16], 16)
-        ns_count = int(header[16:20], 16)
-        ar_count = int(header[20:24], 16)
-
-        counts = [an_count, ns_count, ar_count]
-
-        rest = answer
-        for count in counts:
-            answers = []
-            print(count)
-            prev_n = name
-            n = name
-
-            for i in range(count):
-                n = self.extract_name(r, r.index(rest))
-                t = rest[4:8]
-                ttl = rest[12:20]
-                data_len = rest[20:24]
-
-                data_length = int(data_len, 16) * 2
-                data = rest[24:24 + data_length]
-
-                link = str(bin(int(data[-4:], 16)))[2:]
-                if t == "0002" and data[-2:] != "00" and link[:2] == "11":
-                    link = int(link[2:], 2) * 2
-                    _, offset = get_name(r[link:], 0)
-                    ending = r[link:link+offset] + "00"
-                    data = data[:-4] + ending
-
-                ans = Response(t, data, ttl)
-
-                rest = rest[24 + data_length:]
-
-                if n != prev_n:
-                    cache[(n, QTYPE.get(int(t, 16)))] = [ans]
-                    answers = []
-                else:
-                    answers.append(ans)
-                print(answers, "ans")
-                prev_n = n
-
-            if len(answers) != 0:
-                cache[(n, QTYPE.get(int(t, 16)))] = answers
-
-        # сохранение обновленного кэша
-        with open("cache", "wb+") as f:
-            pickle.dump(cache, f)
-
-        return r
+        try:
+            while True:
+                try:
+                    # сокет отдаёт байты, конвейер работает с ними же
+                    received, addr = self.socket.recvfrom(self.config.buffer_size)
+                    # ограничение частоты запросов до разбора и кэша
+                    if self.limiter is not None:
+                        action = self.limiter.check(addr)
+                        if action != ALLOW:
+                            if action == TRUNCATE:
+                                self.socket.sendto(truncated(received), addr)
+                            continue
+                    response = serve_request(self.pipeline, received, addr[0])
+                    if response is not None:
+                        self.socket.sendto(response, addr)
+                except Exception as e:
+                    log("error", detail=repr(e))
+        except KeyboardInterrupt:
+            # сохранение кэша при остановке
+            self.cache.dump_to_file(self.config.cache_dump)
 
 if __name__ == '__main__':
-    host = 'localhost'
-    port = 53
-    socket = socket(AF_INET, SOCK_DGRAM)
-    socket.bind((host, port))
-    server = Server(socket)
-    server.start()
\ No newline at end of file
+    config = Config()
+    config.cache_dump = "cache"
+    config.cache_max_records = MAX_RECORDS
+    if os.path.exists("blocklist"):
+        config.blocklist = "blocklist"
+    if os.path.exists("hosts"):
+        config.hosts = "hosts"
+    querylog.open("queries.log")
+    sock = socket(AF_INET, SOCK_DGRAM)
+    sock.bind(('localhost', 53))
+    server = Server(sock, config, RateLimiter(rate=100, burst=200))
+    server.start()
@@ -0,0 +1,207 @@
+import struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    # optional: without NumPy the columns are stdlib arrays filled per packet
+    np = None
+
+HEADER = struct.Struct("!HHHHHH")
+MAX_LABELS = 128
+
+# one column per header / question field, unsigned 16 bit unless noted
+COLUMNS = ('id', 'flags', 'qdcount', 'ancount', 'nscount', 'arcount',
+           'qr', 'opcode', 'rcode', 'qname_offset', 'qname_length',
+           'qtype', 'qclass', 'valid')
+
+
+def decode_batch(packets, use_numpy=None):
+    """
+        Decode the headers and first questions of many DNS messages into
+        columns (dict of equal length arrays, see COLUMNS). The packets are
+        joined into one buffer, returned as columns['data'];
+        qname_offset is the offset of the question name in it and
+        qname_length its wire length. valid is 0 for packets too short to
+        hold a header and a question.
+    """
+    packets = list(packets)
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return _decode_numpy(packets)
+    return _decode_python(packets)
+
+
+def _decode_numpy(packets):
+    if np is None:
+        raise ImportError('decode_batch(use_numpy=True) needs numpy')
+    data = b''.join(packets)
+    # the capture stays one byte per byte, only gathered values are widened
+    buf = np.frombuffer(data or bytes(1), dtype=np.uint8)
+    last = len(buf) - 1
+
+    def gather(index):
+        return buf[np.minimum(index, last)].astype(np.int64)
+
+    lengths = np.fromiter(map(len, packets), dtype=np.int64, count=len(packets))
+    starts = np.zeros(len(packets), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    ends = starts + lengths
+    valid = lengths >= 17
+
+    # fixed header fields: gather the same byte offsets of every packet at once
+    safe = np.where(valid, starts, 0)
+    fields = [(gather(safe + i) << 8) | gather(safe + i + 1) for i in range(0, 12, 2)]
+    flags = fields[1]
+
+    # walk the question names label by label for all packets together:
+    # each pass advances every packet that has not reached its root label
+    position = safe + 12
+    active = valid.copy()
+    for _ in range(MAX_LABELS):
+        if not active.any():
+            break
+        label = np.where(active, gather(position), 0)
+        bad = active & ((label >= 0xc0) | (position + label + 1 >= ends))
+        valid &= ~bad
+        active &= ~bad & (label != 0)
+        position = np.where(active, position + label + 1, position)
+    valid &= position + 5 <= ends
+    question = np.where(valid, position + 1, 0)
+
+    columns = {
+        'data': data,
+        'id': fields[0], 'flags': flags,
+        'qdcount': fields[2], 'ancount': fields[3], 'nscount': fields[4], 'arcount': fields[5],
+        'qr': flags >> 15, 'opcode': (flags >> 11) & 0xf, 'rcode': flags & 0xf,
+        'qname_offset': safe + 12,
+        'qname_length': np.where(valid, position + 1 - safe - 12, 0),
+        'qtype': (gather(question) << 8) | gather(question + 1),
+        'qclass': (gather(question + 2) << 8) | gather(question + 3),
+        'valid': valid,
+    }
+    for name in COLUMNS:
+        columns[name] = np.where(valid, columns[name], 0).astype(
+            np.uint32 if name == 'qname_offset' else np.bool_ if name == 'valid' else np.uint16)
+    return columns
+
+
+def _decode_python(packets):
+    columns = {name: array('L' if name == 'qname_offset' else 'H') for name in COLUMNS}
+    offset = 0
+    for packet in packets:
+        row = _decode_one(packet)
+        if row is None:
+            row = (0,) * 11 + (0, 0, 0)
+        else:
+            row = row[:9] + (offset + 12,) + row[9:] + (1,)
+        for name, value in zip(COLUMNS, row):
+            columns[name].append(value)
+        offset += len(packet)
+    columns['data'] = b''.join(packets)
+    return columns
+
+
+def _decode_one(packet):
+    if len(packet) < 17:
+        return None
+    fields = HEADER.unpack_from(packet)
+    flags = fields[1]
+    position = 12
+    for _ in range(MAX_LABELS):
+        label = packet[position]
+        if label >= 0xc0 or position + label + 1 >= len(packet):
+            return None
+        if not label:
+            break
+        position += label + 1
+    else:
+        return None
+    if position + 5 > len(packet):
+        return None
+    qtype, qclass = struct.unpack_from("!HH", packet, position + 1)
+    return fields + (flags >> 15, (flags >> 11) & 0xf, flags & 0xf,
+                     position + 1 - 12, qtype, qclass)
+
+
+def qname(columns, row: int) -> str:
+    """
+        Decode the question name of one row
+    """
+    data = columns['data']
+    position = int(columns['qname_offset'][row])
+    end = position + int(columns['qname_length'][row]) - 1
+    labels = []
+    while position < end:
+        length = data[position]
+        labels.append(data[position + 1:position + 1 + length].decode('ascii', 'replace'))
+        position += length + 1
+    return '.'.join(labels) + '.'
+
+
+# pcap link types: header length before the IP packet, offset of its
+# ethertype in that header (None: the IP version nibble tells)
+LINK_TYPES = {
+    1: (14, 12),     # Ethernet (802.1Q tags are skipped)
+    101: (0, None),  # raw IP
+    113: (16, 14),   # Linux cooked capture, tcpdump -i any
+    276: (20, 0),    # Linux cooked capture v2
+}
+
+
+def read_pcap(filename: str):
+    """
+        Yield the UDP port 53 payloads of a classic pcap file (Ethernet,
+        raw IP or Linux cooked captures; IPv4 or IPv6)
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(24)
+        magic = header[:4]
+        if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+            order = '<'
+        elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+            order = '>'
+        else:
+            raise ValueError('Not a pcap file')
+        # the upper bits of the link type field may carry FCS information
+        linktype = struct.unpack_from(order + 'I', header, 20)[0] & 0xffff
+        if linktype not in LINK_TYPES:
+            raise ValueError('Unsupported pcap link type %d' % linktype)
+        record = struct.Struct(order + 'IIII')
+        while True:
+            head = f.read(record.size)
+            if len(head) < record.size:
+                return
+            _, _, captured, _ = record.unpack(head)
+            frame = f.read(captured)
+            payload = _udp_payload(frame, linktype)
+            if payload is not None:
+                yield payload
+
+
+def _udp_payload(frame: bytes, linktype: int = 1):
+    offset, field = LINK_TYPES[linktype]
+    if len(frame) < offset + 1:
+        return None
+    if field is None:
+        ethertype = {4: 0x0800, 6: 0x86dd}.get(frame[0] >> 4, 0)
+    else:
+        ethertype = struct.unpack_from('!H', frame, field)[0]
+        if ethertype == 0x8100 and linktype == 1 and len(frame) >= 18:
+            ethertype = struct.unpack_from('!H', frame, 16)[0]
+            offset += 4
+    if ethertype == 0x0800:
+        protocol = frame[offset + 9] if len(frame) > offset + 9 else 0
+        offset += (frame[offset] & 0x0f) * 4
+    elif ethertype == 0x86dd:
+        protocol = frame[offset + 6] if len(frame) > offset + 6 else 0
+        offset += 40
+    else:
+        return None
+    if protocol != 17 or len(frame) < offset + 8:
+        return None
+    source, destination = struct.unpack_from('!HH', frame, offset)
+    if 53 not in (source, destination):
+        return None
+    return frame[offset + 8:]
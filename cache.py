@@ -1,40 +1,345 @@
-from decimal import Decimal
+from threading import Lock
 from time import time
-import pickle
 
-from dnsUtils import DNSQuestion
+from dnsUtils import RR, RD, QTYPE, COMPRESSED
+from snapshot import Snapshot, SnapshotError, write_snapshot
+from querylog import log
+from sketch import TinyLFU
 import conf
 
+CLEAN_INTERVAL = 120
+MAX_CHAIN = 8
+
 class Cache:
-    def __init__(self):
+    def __init__(self, snapshot: Snapshot = None, max_records: int = None, admission: bool = True,
+                 clock=time):
+        # clock is injectable so the simulator can replay logs on virtual time
+        self._clock = clock
         self._cache = {}
         self._time = {}
         self._record_type = {}
+        self._snapshot = snapshot
+        # snapshot keys purged since the snapshot was loaded
+        self._purged = set()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        # bounded cache: LRU order is the dict order, TinyLFU guards inserts
+        self.max_records = max_records
+        self.admission = TinyLFU(max_records) if max_records and admission else None
+        self._cleaned = self._clock()
 
-    def add(self, tup: tuple[str, str], record: DNSQuestion, record_type: str):
-        self._cache[tup] = record
+    def _drop_key(self, tup: tuple[str, str]):
+        self._cache.pop(tup, None)
+        self._time.pop(tup, None)
+        self._record_type.pop(tup, None)
+
+    def _make_room(self, tup: tuple[str, str], admit: bool = True) -> bool:
+        """
+            Evict the LRU record if the cache is full. A new key only
+            displaces a live victim if TinyLFU rates it more popular.
+        """
+        if self.max_records is None or tup in self._cache or len(self._cache) < self.max_records:
+            return True
+        victim = next(iter(self._cache))
+        if admit and self.admission is not None and self._time.get(victim, 0) > self._clock() \
+                and not self.admission.admit(tup, victim):
+            self.rejected += 1
+            return False
+        self._drop_key(victim)
+        return True
+
+    def add(self, tup: tuple[str, str], record: list[RR], record_type: str, ttl: int = None):
+        # expired records are swept here, every CLEAN_INTERVAL seconds
+        now = self._clock()
+        if now - self._cleaned >= CLEAN_INTERVAL:
+            self._clean()
+            self._cleaned = now
+        if not self._make_room(tup):
+            log('cache_reject', tup[0], tup[1])
+            return
+        # the record goes in last, readers on other threads test _cache first
+        ttl = conf.TTL if ttl is None else ttl
+        self._time[tup] = ttl + now
         self._record_type[tup] = record_type
-        print(tup[0])
-        self._time[tup] = conf.TTL + time()
+        self._cache[tup] = record
+        self._purged.discard(tup)
+        log('cache_add', tup[0], tup[1], ttl)
+
+    def get(self, tup: tuple[str, str]):
+        entry = self.get_with_ttl(tup)
+        return entry[0] if entry is not None else None
+
+    def get_with_ttl(self, tup: tuple[str, str], count: bool = True):
+        """
+            Return (record, remaining seconds) or None. With count=False
+            the probe is left out of hits / misses, the caller counts
+            the client lookup once with count().
+        """
+        if self.admission is not None:
+            self.admission.record(tup)
+        if tup not in self._cache and self._snapshot is not None:
+            self._restore(tup)
+        record = self._cache.get(tup)
+        if record is not None:
+            remaining = self._time.get(tup, 0) - self._clock()
+            if remaining > 0:
+                if count:
+                    self.hits += 1
+                if self.max_records is not None:
+                    self._cache[tup] = self._cache.pop(tup)
+                return record, int(remaining)
+        if count:
+            self.misses += 1
+        return None
+
+    def count(self, tup: tuple[str, str], hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def _restore(self, tup: tuple[str, str]):
+        if tup in self._purged:
+            return
+        entry = self._snapshot.get(tup, self._clock())
+        if entry is not None and self._make_room(tup, admit=False):
+            self._time[tup], self._record_type[tup], self._cache[tup] = entry
+
+    def _clean(self):
+        now = self._clock()
+        for tup in [tup for tup, expiry in self._time.items() if expiry <= now]:
+            self._drop_key(tup)
+
+    def _live(self, now):
+        # list() copies the items in one step, the request path may be
+        # writing to the dict from another thread
+        for tup, record in list(self._cache.items()):
+            expiry = self._time.get(tup, 0)
+            if expiry > now:
+                yield tup, expiry, self._record_type.get(tup, tup[1]), record
+
+    def _entries(self):
+        now = self._clock()
+        yield from self._live(now)
+        if self._snapshot is not None:
+            for entry in self._snapshot.items(now):
+                if entry[0] not in self._cache and entry[0] not in self._purged:
+                    yield entry
+
+    def _drop(self, match):
+        keys = [tup for tup in list(self._cache) if match(tup)]
+        for tup in keys:
+            self._drop_key(tup)
+        return keys
+
+    def _tombstone(self, tup) -> bool:
+        # keep a purged snapshot record from being restored
+        if tup in self._purged:
+            return False
+        self._purged.add(tup)
+        return True
+
+    def purge(self, match) -> int:
+        """
+            Drop every record whose key satisfies match(tup)
+        """
+        purged = set(self._drop(match))
+        if self._snapshot is not None:
+            for tup in self._snapshot.keys(self._clock()):
+                if match(tup) and self._tombstone(tup):
+                    purged.add(tup)
+        return len(purged)
+
+    def stats(self) -> dict:
+        return {'records': len(self._cache),
+                'snapshot': len(self._snapshot) if self._snapshot is not None else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'rejected': self.rejected}
+
+    @staticmethod
+    def from_dump(filename: str, **kwargs) -> 'Cache':
+        try:
+            snapshot = Snapshot(filename)
+            print(f'Get saved cache: {len(snapshot)} records.')
+            return Cache(snapshot, **kwargs)
+        except (OSError, SnapshotError) as e:
+            print(f'No cache: {e}')
+            return Cache(**kwargs)
+
+    def dump_to_file(self, filename: str, close: bool = True):
+        write_snapshot(filename, list(self._entries()))
+        if close and self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+
+class ShardedCache:
+    """
+        Cache split into lock-striped shards so it can be shared by worker
+        threads. Every operation takes only the lock of the key's shard.
+    """
+
+    def __init__(self, shards: int = 16, snapshot: Snapshot = None,
+                 max_records: int = None, admission: bool = True, clock=time):
+        per_shard = max(1, max_records // shards) if max_records else None
+        self._clock = clock
+        self._shards = [Cache(snapshot, per_shard, admission, clock) for _ in range(shards)]
+        self._locks = [Lock() for _ in range(shards)]
+        self._snapshot = snapshot
+
+    def _shard(self, tup: tuple[str, str]):
+        i = hash(tup) % len(self._shards)
+        return self._shards[i], self._locks[i]
+
+    def add(self, tup: tuple[str, str], record: list[RR], record_type: str, ttl: int = None):
+        shard, lock = self._shard(tup)
+        with lock:
+            shard.add(tup, record, record_type, ttl)
+
+    def get(self, tup: tuple[str, str]):
+        shard, lock = self._shard(tup)
+        with lock:
+            return shard.get(tup)
+
+    def get_with_ttl(self, tup: tuple[str, str], count: bool = True):
+        shard, lock = self._shard(tup)
+        with lock:
+            return shard.get_with_ttl(tup, count)
+
+    def count(self, tup: tuple[str, str], hit: bool):
+        shard, lock = self._shard(tup)
+        with lock:
+            shard.count(tup, hit)
+
+    def get_or_add(self, tup: tuple[str, str], record: list[RR], record_type: str, ttl: int = None):
+        """
+            Return the live cached record for tup, or store and return record
+        """
+        shard, lock = self._shard(tup)
+        with lock:
+            cached = shard.get(tup)
+            if cached is not None:
+                return cached
+            shard.add(tup, record, record_type, ttl)
+            return record
 
     def _clean(self):
-        names = list(self._cache.keys())
-        for record in names:
-            if Decimal(self._time[record]) < Decimal(time()):
-                self._cache.pop(record)
-                self._time.pop(record)
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard._clean()
+
+    def _entries(self):
+        now = self._clock()
+        seen = set()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                live = list(shard._live(now))
+            seen.update(entry[0] for entry in live)
+            yield from live
+        if self._snapshot is not None:
+            for entry in self._snapshot.items(now):
+                if entry[0] not in seen and entry[0] not in self._shard(entry[0])[0]._purged:
+                    yield entry
+
+    def purge(self, match) -> int:
+        purged = set()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                purged.update(shard._drop(match))
+        if self._snapshot is not None:
+            for tup in self._snapshot.keys(self._clock()):
+                if match(tup):
+                    shard, lock = self._shard(tup)
+                    with lock:
+                        if shard._tombstone(tup):
+                            purged.add(tup)
+        return len(purged)
+
+    def stats(self) -> dict:
+        stats = {'shards': len(self._shards)}
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                for key, value in shard.stats().items():
+                    stats[key] = stats.get(key, 0) + value
+        stats['snapshot'] = len(self._snapshot) if self._snapshot is not None else 0
+        return stats
 
     @staticmethod
-    def from_dump(filename: str) -> 'Cache':
+    def from_dump(filename: str, shards: int = 16, **kwargs) -> 'ShardedCache':
         try:
-            with open(filename, 'rb') as dump:
-                cache = pickle.load(dump)
-            print('Get saved cache.')
-            return cache
-        except EOFError:
-            print('No cache.')
-            return Cache()
-
-    def dump_to_file(self, filename: str):
-        with open(filename, 'wb+') as dump:
-            pickle.dump(self, dump)
\ No newline at end of file
+            snapshot = Snapshot(filename)
+            print(f'Get saved cache: {len(snapshot)} records.')
+            return ShardedCache(shards, snapshot, **kwargs)
+        except (OSError, SnapshotError) as e:
+            print(f'No cache: {e}')
+            return ShardedCache(shards, **kwargs)
+
+    def dump_to_file(self, filename: str, close: bool = True):
+        write_snapshot(filename, list(self._entries()))
+        if close and self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+            for shard in self._shards:
+                shard._snapshot = None
+
+
+def store_rrsets(cache, qname, qtype: int, rrs: list[RR]):
+    """
+        Cache the RRsets answering (qname, qtype): the CNAME chain from
+        qname and the records of its target, each under its own key and
+        with its own TTL, so links and targets expire separately. RRs off
+        that chain are ignored, a server cannot plant other names. Nor are
+        unparsed rdata that may hold compression pointers, they would not
+        survive being packed into another reply.
+    """
+    rrsets = {}
+    for rr in rrs:
+        rrsets.setdefault((str(rr.rname).lower(), rr.rtype), []).append(rr)
+    name = str(qname).lower()
+    for _ in range(MAX_CHAIN):
+        rrset = rrsets.get((name, qtype))
+        link = rrset is None and qtype != QTYPE.CNAME
+        if link:
+            rrset = rrsets.get((name, QTYPE.CNAME))
+        if rrset is None or (rrset[0].rtype in COMPRESSED and type(rrset[0].rdata) is RD):
+            return
+        tup = (name, QTYPE.get(rrset[0].rtype))
+        ttl = min(rr.ttl for rr in rrset)
+        if ttl > 0:
+            cache.add(tup, rrset, tup[1], ttl)
+        if not link:
+            return
+        name = str(rrset[0].rdata.label).lower()
+
+
+def get_chain(cache, tup: tuple[str, str], count: bool = True):
+    """
+        Assemble an answer for tup from cached RRsets, following cached
+        CNAME links. RRs are copied with their remaining TTL.
+        Returns (answer, name) where name is None if the chain is complete,
+        or the first name whose data is not cached. Counts as one hit or
+        miss however many RRsets were probed (none with count=False).
+    """
+    name, record_type = tup
+    answer = []
+    for _ in range(MAX_CHAIN):
+        entry = cache.get_with_ttl((name, record_type), count=False)
+        link = entry is None and record_type != 'CNAME'
+        if link:
+            entry = cache.get_with_ttl((name, 'CNAME'), count=False)
+        if entry is None:
+            if count:
+                cache.count(tup, False)
+            return answer, name
+        record, remaining = entry
+        answer.extend(RR(rr.rname, rr.rtype, rr.rclass, remaining, rr.rdata) for rr in record)
+        if not link:
+            if count:
+                cache.count(tup, True)
+            return answer, None
+        name = str(record[0].rdata.label).lower()
+    if count:
+        cache.count(tup, False)
+    return [], tup[0]
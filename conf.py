@@ -3,14 +3,90 @@ class Config:
     def __init__(self):
         self.timeout = 0.5
         self.buffer_size = 1024
+        # datagrams drained per selector wakeup
+        self.batch_size = 64
         self.cache_dump = 'dns.cache'
+        # origin -> zone file served authoritatively
+        self.zones = {}
+        # answer RFC 6761 / 6303 special-use and private reverse names
+        # locally, optionally with addresses from a hosts-style file
+        self.special_zones = True
+        self.hosts = None
+        # sinkhole / rewrite rules, one "name [address]" per line
+        self.blocklist = None
+        # 0 serves requests inline, N > 0 uses a pool of N worker threads
+        # sharing a ShardedCache (also used with peering, warm-up or the
+        # control socket)
+        self.workers = 0
+        self.cache_shards = 16
+        # with workers: cache hits are answered on the receiving thread,
+        # at most max_pending misses wait for a worker (the rest get
+        # shed_rcode) and misses older than query_deadline are dropped
+        self.max_pending = 256
+        self.query_deadline = 2.0
+        self.shed_rcode = 'SERVFAIL'
+        # None keeps the cache unbounded; with a limit, new records must
+        # pass the TinyLFU admission filter to evict a live one
+        self.cache_max_records = None
+        self.cache_admission = True
+        # cache hits are answered from compiled pack plans, at most this
+        # many keys keep one (0 packs every hit)
+        self.cache_plans = 4096
+        # 'forward' sends misses to forwarder_address, 'iterative' resolves
+        # them from the root hints (or root_hints: [(name, address)])
+        self.resolver = 'forward'
+        self.root_hints = None
+        self.resolver_port = 53
+        # forward mode upstreams (default: forwarder_address); timeout is
+        # the initial RTO before any RTT has been measured
+        self.upstreams = None
+        self.hedge = True
+        # 'udp', or 'tcp' / 'tls' for persistent pipelined connections to
+        # the first upstream (tls on port 853 unless one is given)
+        self.upstream_transport = 'udp'
+        self.upstream_connections = 2
+        self.tls_server_name = None
+        self.tls_ca_file = None
+        # conditional forwarding: suffix -> upstream addresses, or
+        # {'upstreams': [...], 'timeout': ..., 'hedge': ...}; other names
+        # use the resolver above
+        self.forward_rules = {}
+        # cache peering: this node's peer port and its siblings' ones; a
+        # miss first asks the sibling owning the name on the hash ring
+        self.peer_address = None
+        self.peers = []
+        self.peer_timeout = 0.02
+        # shared key signing the fills siblings send each other; without
+        # one a fill is trusted on its source address alone
+        self.peer_secret = None
+        # EDNS client subnet: send the client's /24 (IPv6 /56) upstream and
+        # cache answers per returned scope
+        self.ecs = False
+        self.ecs_prefix_v4 = 24
+        self.ecs_prefix_v6 = 56
+        # responses per second per client /24 (IPv6 /56), 0 disables
+        self.rate_limit = 0
+        self.rate_burst = 40
+        self.rate_slip = 2
+        # "name [type]" list resolved into the cache at startup (e.g. from
+        # python warmup.py N queries.log), before the listener opens if
+        # warmup_wait, otherwise alongside it
+        self.warmup = None
+        self.warmup_rate = 200
+        self.warmup_concurrency = 32
+        self.warmup_wait = False
+        # jsonl query log (None disables), every N-th event is kept
+        self.query_log = None
+        self.query_log_sample = 1
+        # unix socket for stats / list / purge / snapshot commands
+        self.control_socket = None
 
 
     @property
     def local_server_address(self) -> tuple[str, int]:
         return 'localhost', 53
 
-    @staticmethod
+    @property
     def forwarder_address(self) -> tuple[str, int]:
         return '8.8.8.8', 53
 
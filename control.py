@@ -0,0 +1,137 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from time import time
+
+from sketch import hitters
+
+
+class ControlError(Exception):
+    pass
+
+
+def _name(name: str) -> str:
+    # cache keys are lower-case names with the trailing dot
+    return name.lower().rstrip('.') + '.'
+
+
+class Commands:
+    """
+        Control commands over a running cache:
+
+            stats
+            list <prefix>
+            purge <name> [type]
+            purge-suffix <suffix>
+            snapshot
+    """
+
+    def __init__(self, cache, config, pipeline=None, pending=None):
+        self.cache = cache
+        self.config = config
+        self.pipeline = pipeline
+        self.pending = pending
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['top'] = hitters.stats()
+        if self.pipeline is not None:
+            stats['stages'] = self.pipeline.stats()
+        if self.pending is not None:
+            stats['pending'] = self.pending.stats()
+        return stats
+
+    def list(self, prefix=''):
+        prefix = prefix.lower()
+        now = time()
+        return [{'name': tup[0], 'type': tup[1], 'ttl': int(expiry - now)}
+                for tup, expiry, _, _ in self.cache._entries()
+                if tup[0].startswith(prefix)]
+
+    def purge(self, name, record_type=None):
+        name = _name(name)
+        return {'purged': self.cache.purge(
+            lambda tup: tup[0] == name and (record_type is None or tup[1] == record_type.upper()))}
+
+    def purge_suffix(self, suffix):
+        suffix = _name(suffix)
+        dotted = '.' + suffix
+        return {'purged': self.cache.purge(
+            lambda tup: tup[0] == suffix or tup[0].endswith(dotted))}
+
+    def snapshot(self):
+        self.cache.dump_to_file(self.config.cache_dump, close=False)
+        return {'snapshot': self.config.cache_dump}
+
+    def run(self, line: str):
+        args = line.split()
+        if not args:
+            raise ControlError('Empty command')
+        command = getattr(self, args[0].replace('-', '_'), None)
+        if args[0].startswith('_') or args[0] == 'run' or not callable(command):
+            raise ControlError(f'Unknown command: {args[0]}')
+        try:
+            return command(*args[1:])
+        except TypeError:
+            raise ControlError(f'Bad arguments for {args[0]}')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline().decode().strip()
+        try:
+            result = {'ok': True, 'result': self.server.commands.run(line)}
+        except ControlError as e:
+            result = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(result).encode() + b'\n')
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        Unix socket serving one command per connection in its own thread,
+        so commands never stall the query loop
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str, commands: Commands):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.commands = commands
+        super().__init__(path, _Handler)
+        self.path = path
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def send_command(path: str, line: str):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        client.sendall(line.encode() + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        return json.loads(data)
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    # python control.py /run/dns.ctl purge example.com A
+    print(json.dumps(send_command(sys.argv[1], ' '.join(sys.argv[2:])), indent=2))
@@ -1,7 +1,9 @@
-import binascii, random, socket, struct
+import asyncio, binascii, queue, random, socket, struct, threading
 from dnslib.label import DNSLabel, DNSBuffer
+# DNSBuffer raises dnslib's BufferError, not the builtin one
+from dnslib.buffer import BufferError
 from ranges import BYTES, H,I,IP4,IP6,\
-                          check_bytes
+                          check_bytes, ntuple_range
 from buffer import Buffer
 from itertools import chain
 from lex import WordLexer
@@ -27,10 +29,18 @@ class Bimap(object):
         except KeyError as e:
             return default or str(k)
 
+    def __getattr__(self, k):
+        try:
+            if k.startswith('__') and k.endswith('__'):
+                raise AttributeError()
+            return self.reverse[k]
+        except KeyError as e:
+            raise self.error("%s: Invalid reverse lookup: [%s]" % (self.name, k))
+
 
 QTYPE = Bimap('QTYPE',
-              {1: 'A', 2: 'NS', 12: 'PTR',
-               28: 'AAAA',}, DNSError)
+              {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 12: 'PTR', 15: 'MX',
+               16: 'TXT', 28: 'AAAA', 33: 'SRV', 41: 'OPT',}, DNSError)
 
 CLASS = Bimap('CLASS',
               {1: 'IN', 2: 'CS', 3: 'CH', 4: 'Hesiod', 254: 'None', 255: '*'},
@@ -313,6 +323,25 @@ class DNSUtils(object):
             ar.pack(buffer)
         return buffer.data
 
+    def compile(self):
+        """
+            Pack once into a PackPlan, for answers sent again and again
+            with only the id, flags and TTLs changed
+        """
+        self.set_header_qa()
+        buffer = DNSBuffer()
+        self.header.pack(buffer)
+        for q in self.questions:
+            q.pack(buffer)
+        question = buffer.offset - 12
+        ttls = []
+        for rr in chain(self.rr, self.auth, self.ar):
+            offset = rr.pack(buffer)
+            # the OPT "ttl" holds the extended rcode and flags
+            if rr.rtype != QTYPE.OPT:
+                ttls.append(offset)
+        return PackPlan(buffer.data, ttls, question)
+
     def truncate(self):
         return DNSUtils(DNSHeader(id=self.header.id,
                                   bitmap=self.header.bitmap,
@@ -338,11 +367,8 @@ class DNSUtils(object):
                     sock.settimeout(timeout)
                 sock.connect((dest, port))
                 sock.sendall(data)
-                response = sock.recv(8192)
-                length = struct.unpack("!H", bytes(response[:2]))[0]
-                while len(response) - 2 < length:
-                    response += sock.recv(8192)
-                response = response[2:]
+                length = struct.unpack("!H", recv_exact(sock, 2))[0]
+                response = recv_exact(sock, length)
             else:
                 sock = socket.socket(inet, socket.SOCK_DGRAM)
                 if timeout is not None:
@@ -350,9 +376,118 @@ class DNSUtils(object):
                 sock.sendto(self.pack(), (dest, port))
                 response, server = sock.recvfrom(8192)
         finally:
-            pass
+            if sock is not None:
+                sock.close()
         return response
 
+    async def send_async(self, dest, port=53, timeout=None, ipv6=False, transport=None):
+        """
+            Send packet over a shared UDP transport and await the response.
+            Without a transport a temporary one is opened for this query.
+        """
+        if transport is not None:
+            return await transport.query(self, timeout)
+        transport = await AsyncTransport.open(dest, port, ipv6)
+        try:
+            return await transport.query(self, timeout)
+        finally:
+            transport.close()
+
+    @classmethod
+    async def resolve_many(cls, names, qtype="A", dest="8.8.8.8", port=53,
+                           concurrency=100, timeout=2, ipv6=False):
+        """
+            Resolve names with up to `concurrency` queries in flight over
+            shared sockets. Yields (name, DNSUtils) in completion order, or
+            (name, exception) for queries that failed or timed out.
+        """
+        names = iter(names)
+        results = asyncio.Queue()
+        transports = [await AsyncTransport.open(dest, port, ipv6)
+                      for _ in range(min(8, 1 + concurrency // 256))]
+
+        async def worker(transport):
+            for name in names:
+                try:
+                    q = cls.question(name, qtype)
+                    result = cls.parse(await q.send_async(dest, port, timeout, transport=transport))
+                except Exception as e:
+                    # bad names and timeouts are reported, not raised
+                    result = e
+                await results.put((name, result))
+            await results.put(None)
+
+        workers = [asyncio.ensure_future(worker(transports[i % len(transports)]))
+                   for i in range(concurrency)]
+        try:
+            running = len(workers)
+            while running:
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                else:
+                    yield item
+        finally:
+            for w in workers:
+                w.cancel()
+            for transport in transports:
+                transport.close()
+
+    @classmethod
+    def resolve_many_sync(cls, names, qtype="A", **kwargs):
+        """
+            resolve_many for synchronous code: the event loop runs in a
+            background thread and results are yielded as they arrive.
+            Closing the generator early cancels the outstanding queries.
+        """
+        results = queue.Queue(maxsize=1024)
+        done = object()
+        stop = threading.Event()
+        running = {}
+
+        async def consume():
+            running['loop'] = asyncio.get_running_loop()
+            running['task'] = asyncio.current_task()
+            if stop.is_set():
+                return
+            async for item in cls.resolve_many(names, qtype, **kwargs):
+                # never block the loop, it has to see the cancel
+                while True:
+                    try:
+                        results.put_nowait(item)
+                        break
+                    except queue.Full:
+                        await asyncio.sleep(0.01)
+
+        def run():
+            try:
+                asyncio.run(consume())
+            except asyncio.CancelledError:
+                pass
+            finally:
+                while not stop.is_set():
+                    try:
+                        results.put(done, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+        threading.Thread(target=run, daemon=True).start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    return
+                yield item
+        finally:
+            stop.set()
+            if 'task' in running:
+                try:
+                    running['loop'].call_soon_threadsafe(running['task'].cancel)
+                except RuntimeError:
+                    # the loop has already finished
+                    pass
+
     def format(self, prefix="", sort=False):
         """
             Formatted 'repr'-style representation of record
@@ -417,6 +552,113 @@ class DNSUtils(object):
                 err.append((None, b[e]))
         return err
 
+class PackPlan(object):
+    """
+        A packed message kept for reuse: the bytes, with names already
+        compressed, and the offsets of the fields that change between
+        sends. pack() is a copy and a few pack_into calls.
+    """
+
+    def __init__(self, data, ttls, question):
+        self.data = bytes(data)
+        self.ttls = tuple(ttls)
+        self.question = question
+        self.flags = struct.unpack_from("!H", self.data, 2)[0]
+
+    def pack(self, id=None, flags=None, ttl=None, question=None):
+        """
+            ttl is one value for every RR or a sequence with one per RR
+            in section order (OPT excluded); question replaces the
+            question section verbatim and must have its length
+        """
+        data = bytearray(self.data)
+        if id is not None:
+            struct.pack_into("!H", data, 0, id)
+        if flags is not None:
+            struct.pack_into("!H", data, 2, flags)
+        if question is not None:
+            if len(question) != self.question:
+                raise DNSError("Question of %d bytes does not fit plan (%d)" % (
+                    len(question), self.question))
+            data[12:12 + self.question] = question
+        if ttl is not None:
+            if isinstance(ttl, int):
+                for offset in self.ttls:
+                    struct.pack_into("!I", data, offset, ttl)
+            else:
+                for offset, value in zip(self.ttls, ttl):
+                    struct.pack_into("!I", data, offset, value)
+        return bytes(data)
+
+def recv_exact(sock, length):
+    """
+        Read exactly length bytes from a stream socket into one buffer
+    """
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise DNSError("Connection closed after %d of %d bytes" % (received, length))
+        received += count
+    return bytes(buffer)
+
+
+class AsyncTransport(asyncio.DatagramProtocol):
+    """
+        Connected UDP endpoint shared by many pipelined queries.
+        Each query gets a free 16-bit id and responses are matched back
+        to the waiting future by id.
+    """
+
+    @classmethod
+    async def open(cls, dest, port=53, ipv6=False):
+        loop = asyncio.get_running_loop()
+        family = socket.AF_INET6 if ipv6 else socket.AF_INET
+        _, protocol = await loop.create_datagram_endpoint(
+            cls, remote_addr=(dest, port), family=family)
+        return protocol
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 2:
+            return
+        future = self.pending.get(struct.unpack("!H", data[:2])[0])
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def query(self, record, timeout=None):
+        if len(self.pending) >= 65536:
+            raise DNSError("No free query ids")
+        qid = random.randint(0, 65535)
+        while qid in self.pending:
+            qid = random.randint(0, 65535)
+        record.header.id = qid
+        future = asyncio.get_running_loop().create_future()
+        self.pending[qid] = future
+        try:
+            self.transport.sendto(record.pack())
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(qid, None)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
 class AAAA(RD):
 
     """
@@ -440,7 +682,6 @@ class AAAA(RD):
         return cls(rd[0])
 
     def __init__(self, data):
-        super().__init__(data)
         if type(data) in (tuple,list):
             self.data = tuple(data)
         else:
@@ -497,8 +738,234 @@ class PTR(CNAME):
 class NS(CNAME):
     pass
 
+class SOA(RD):
 
-RDMAP = { 'A':A, 'AAAA':AAAA, 'PTR':PTR,'NS':NS }
+    times = ntuple_range('times',5,0,4294967295)
+
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            mname = buffer.decode_name()
+            rname = buffer.decode_name()
+            times = buffer.unpack("!IIIII")
+            return cls(mname,rname,times)
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking SOA [offset=%d]: %s" %
+                                        (buffer.offset,e))
+
+    @classmethod
+    def fromZone(cls,rd,origin=None):
+        return cls(label(rd[0],origin),label(rd[1],origin),
+                   [parse_time(t) for t in rd[2:7]])
+
+    def __init__(self,mname=None,rname=None,times=None):
+        super().__init__()
+        self.mname = mname
+        self.rname = rname
+        self.times = tuple(times) if times else (0,0,0,0,0)
+
+    def set_mname(self,mname):
+        if isinstance(mname,DNSLabel):
+            self._mname = mname
+        else:
+            self._mname = DNSLabel(mname)
+
+    def get_mname(self):
+        return self._mname
+
+    mname = property(get_mname,set_mname)
+
+    def set_rname(self,rname):
+        if isinstance(rname,DNSLabel):
+            self._rname = rname
+        else:
+            self._rname = DNSLabel(rname)
+
+    def get_rname(self):
+        return self._rname
+
+    rname = property(get_rname,set_rname)
+
+    def pack(self,buffer):
+        buffer.encode_name(self.mname)
+        buffer.encode_name(self.rname)
+        buffer.pack("!IIIII",*self.times)
+
+    def __repr__(self):
+        return "%s %s %s" % (self.mname,self.rname,
+                             " ".join(map(str,self.times)))
+
+    attrs = ('mname','rname','times')
+
+
+class MX(RD):
+
+    preference = H('preference')
+
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            (preference,) = buffer.unpack("!H")
+            mx = buffer.decode_name()
+            return cls(mx,preference)
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking MX [offset=%d]: %s" %
+                                        (buffer.offset,e))
+
+    @classmethod
+    def fromZone(cls,rd,origin=None):
+        return cls(label(rd[1],origin),int(rd[0]))
+
+    def __init__(self,label=None,preference=10):
+        super().__init__()
+        self.label = label
+        self.preference = preference
+
+    def set_label(self,label):
+        if isinstance(label,DNSLabel):
+            self._label = label
+        else:
+            self._label = DNSLabel(label)
+
+    def get_label(self):
+        return self._label
+
+    label = property(get_label,set_label)
+
+    def pack(self,buffer):
+        buffer.pack("!H",self.preference)
+        buffer.encode_name(self.label)
+
+    def __repr__(self):
+        return "%d %s" % (self.preference,self.label)
+
+    attrs = ('preference','label')
+
+
+class TXT(RD):
+
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            data = []
+            end = buffer.offset + length
+            while buffer.offset < end:
+                (size,) = buffer.unpack("!B")
+                data.append(buffer.get(size))
+            if buffer.offset != end:
+                raise DNSError("TXT strings overrun rdlength %d" % length)
+            return cls(data)
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking TXT [offset=%d]: %s" %
+                                        (buffer.offset,e))
+
+    @classmethod
+    def fromZone(cls,rd,origin=None):
+        return cls([x.encode() for x in rd])
+
+    def __init__(self,data):
+        if type(data) in (tuple,list):
+            self.data = [_force_bytes(x) for x in data]
+        else:
+            self.data = [_force_bytes(data)]
+        if any(len(x) > 255 for x in self.data):
+            raise DNSError("TXT record too long: %s" % self.data)
+
+    def pack(self,buffer):
+        for item in self.data:
+            buffer.pack("!B",len(item))
+            buffer.append(item)
+
+    def __repr__(self):
+        return " ".join('"%s"' % x.decode(errors='replace') for x in self.data)
+
+
+class SRV(RD):
+
+    priority = H('priority')
+    weight = H('weight')
+    port = H('port')
+
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            priority,weight,port = buffer.unpack("!HHH")
+            target = buffer.decode_name()
+            return cls(priority,weight,port,target)
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking SRV [offset=%d]: %s" %
+                                        (buffer.offset,e))
+
+    @classmethod
+    def fromZone(cls,rd,origin=None):
+        return cls(int(rd[0]),int(rd[1]),int(rd[2]),label(rd[3],origin))
+
+    def __init__(self,priority=0,weight=0,port=0,target=None):
+        super().__init__()
+        self.priority = priority
+        self.weight = weight
+        self.port = port
+        self.target = target
+
+    def set_target(self,target):
+        if isinstance(target,DNSLabel):
+            self._target = target
+        else:
+            self._target = DNSLabel(target)
+
+    def get_target(self):
+        return self._target
+
+    target = property(get_target,set_target)
+
+    def pack(self,buffer):
+        buffer.pack("!HHH",self.priority,self.weight,self.port)
+        # RFC 2782: the target is never compressed
+        buffer.encode_name_nocompress(self.target)
+
+    def __repr__(self):
+        return "%d %d %d %s" % (self.priority,self.weight,self.port,self.target)
+
+    attrs = ('priority','weight','port','target')
+
+
+class OPT(RD):
+    """
+        EDNS(0) pseudo-RR data: a list of EDNSOption. The UDP payload size
+        and the extended flags live in the RR class and TTL fields.
+    """
+
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            options = []
+            end = buffer.offset + length
+            while buffer.offset < end:
+                code, size = buffer.unpack("!HH")
+                options.append(EDNSOption(code, buffer.get(size)))
+            return cls(options)
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking OPT [offset=%d]: %s" %
+                                        (buffer.offset,e))
+
+    def __init__(self, options=None):
+        self.options = list(options or [])
+
+    def pack(self,buffer):
+        for option in self.options:
+            option.pack(buffer)
+
+    def __repr__(self):
+        return " ".join(repr(option) for option in self.options)
+
+    attrs = ('options',)
+
+RDMAP = { 'A':A, 'AAAA':AAAA, 'CNAME':CNAME, 'PTR':PTR,'NS':NS,'SOA':SOA,'MX':MX,
+          'TXT':TXT,'SRV':SRV,'OPT':OPT }
+
+# RFC 3597 types whose rdata may carry compressed names. Without an RDMAP
+# class their raw bytes point into the packet they came from.
+COMPRESSED = frozenset((3, 4, 7, 8, 9, 14, 17, 18, 21, 24, 26, 30, 35))
 
 class DNSHeader(object):
     """
@@ -561,6 +1028,66 @@ class DNSHeader(object):
             elif k.lower() == "rcode":
                 self.rcode = v
 
+    def get_qr(self):
+        return get_bits(self.bitmap,15)
+
+    def set_qr(self,val):
+        self.bitmap = set_bits(self.bitmap,val,15)
+
+    qr = property(get_qr,set_qr)
+
+    def get_opcode(self):
+        return get_bits(self.bitmap,11,4)
+
+    def set_opcode(self,val):
+        self.bitmap = set_bits(self.bitmap,val,11,4)
+
+    opcode = property(get_opcode,set_opcode)
+
+    def get_aa(self):
+        return get_bits(self.bitmap,10)
+
+    def set_aa(self,val):
+        self.bitmap = set_bits(self.bitmap,val,10)
+
+    aa = property(get_aa,set_aa)
+
+    def get_tc(self):
+        return get_bits(self.bitmap,9)
+
+    def set_tc(self,val):
+        self.bitmap = set_bits(self.bitmap,val,9)
+
+    tc = property(get_tc,set_tc)
+
+    def get_rd(self):
+        return get_bits(self.bitmap,8)
+
+    def set_rd(self,val):
+        self.bitmap = set_bits(self.bitmap,val,8)
+
+    rd = property(get_rd,set_rd)
+
+    def get_ra(self):
+        return get_bits(self.bitmap,7)
+
+    def set_ra(self,val):
+        self.bitmap = set_bits(self.bitmap,val,7)
+
+    ra = property(get_ra,set_ra)
+
+    def get_rcode(self):
+        return get_bits(self.bitmap,0,4)
+
+    def set_rcode(self,val):
+        self.bitmap = set_bits(self.bitmap,val,0,4)
+
+    rcode = property(get_rcode,set_rcode)
+
+    def pack(self,buffer):
+        buffer.pack("!HHHHHH",self.id,self.bitmap,
+                        self.q,self.a,self.auth,self.ar)
+
 class EDNSOption(object):
     code = H('code')
     data = BYTES('data')
@@ -603,7 +1130,7 @@ class RR(object):
                     buffer, rdlength)
             else:
                 rdata =''
-                return cls(rname, rtype, rclass, ttl, rdata)
+            return cls(rname, rtype, rclass, ttl, rdata)
         except (BufferError, BimapError) as e:
             raise DNSError("Error unpacking RR [offset=%d]: %s" % (
             buffer.offset, e))
@@ -634,14 +1161,21 @@ class RR(object):
     rname = property(get_rname, set_rname)
 
     def pack(self, buffer):
+        """
+            Returns the offset of the TTL field
+        """
         buffer.encode_name(self.rname)
+        ttl = buffer.offset + 4
         buffer.pack("!HHI", self.rtype, self.rclass, self.ttl)
         rdlength_ptr = buffer.offset
         buffer.pack("!H", 0)
         start = buffer.offset
-        self.rdata.pack(buffer)
+        if self.rdata:
+            # empty rdata (an OPT without options) is parsed as ''
+            self.rdata.pack(buffer)
         end = buffer.offset
         buffer.update(rdlength_ptr, "!H", end - start)
+        return ttl
 
     def __repr__(self):
             return "<DNS RR: '%s' rtype=%s rclass=%s ttl=%d rdata='%s'>" % (
@@ -707,8 +1241,12 @@ def parse_time(s):
 
 
 class ZoneParser:
+    """
+        With strict=False a record that cannot be parsed is kept in
+        `skipped` as (tokens, error) and the rest of the zone is read.
+    """
 
-    def __init__(self,zone,origin="",ttl=0):
+    def __init__(self,zone,origin="",ttl=0,strict=True):
         self.l = WordLexer(zone)
         self.l.commentchars = ';'
         self.l.nltok = ('NL',None)
@@ -721,6 +1259,8 @@ class ZoneParser:
         self.ttl = ttl
         self.label = DNSLabel("")
         self.prev = None
+        self.strict = strict
+        self.skipped = []
 
     def expect(self,expect):
         t,val = next(self.i)
@@ -746,12 +1286,27 @@ class ZoneParser:
         rtype = rr.pop(0)
         rdata = rr
         rd = RDMAP.get(rtype,RD)
+        # RFC 3597 generic type: TYPE99 \# 4 0a000001
+        if rtype.startswith('TYPE') and rtype[4:].isdigit():
+            qtype = int(rtype[4:])
+        else:
+            qtype = getattr(QTYPE,rtype)
         return RR(rname=label,
                          ttl=ttl,
                          rclass=getattr(CLASS,rclass),
-                         rtype=getattr(QTYPE,rtype),
+                         rtype=qtype,
                          rdata=rd.fromZone(rdata,self.origin))
 
+    def _record(self,rr):
+        if self.strict:
+            return self.parse_rr(rr)
+        tokens = list(rr)
+        try:
+            return self.parse_rr(rr)
+        except (DNSError,ValueError,IndexError,UnicodeError) as e:
+            self.skipped.append((tokens,e))
+            return None
+
     def __iter__(self):
         return self.parse()
 
@@ -764,7 +1319,9 @@ class ZoneParser:
                 if tok == 'NL':
                     if not paren and rr:
                         self.prev = tok
-                        yield self.parse_rr(rr)
+                        record = self._record(rr)
+                        if record is not None:
+                            yield record
                         rr = []
                 elif tok == 'SPACE' and self.prev == 'NL' and not paren:
                     rr.append('')
@@ -786,4 +1343,6 @@ class ZoneParser:
                 self.prev = tok
         except StopIteration:
             if rr:
-                yield self.parse_rr(rr)
+                record = self._record(rr)
+                if record is not None:
+                    yield record
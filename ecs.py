@@ -0,0 +1,111 @@
+import ipaddress
+import struct
+from threading import Lock
+
+from dnsUtils import DNSUtils, RR, OPT, EDNSOption, QTYPE
+
+ECS = 8
+FAMILY = {4: 1, 6: 2}
+
+
+def _option(opt_rr, code):
+    if isinstance(opt_rr.rdata, OPT):
+        for option in opt_rr.rdata.options:
+            if option.code == code:
+                return option
+    return None
+
+
+def subnet(address: str, prefix: int):
+    return ipaddress.ip_network(f'{address}/{prefix}', strict=False)
+
+
+def encode(address: str, prefix: int) -> EDNSOption:
+    """
+        Client subnet option (RFC 7871): family, source prefix, scope 0 and
+        only the address bytes covered by the prefix
+    """
+    network = subnet(address, prefix)
+    data = network.network_address.packed[:(prefix + 7) // 8]
+    return EDNSOption(ECS, struct.pack('!HBB', FAMILY[network.version], prefix, 0) + data)
+
+
+def with_subnet(request: DNSUtils, address: str, prefix_v4=24, prefix_v6=56,
+                payload=4096) -> bytes:
+    """
+        Pack request for upstream with a client subnet option for address,
+        replacing any the client sent
+    """
+    version = ipaddress.ip_address(address).version
+    option = encode(address, prefix_v4 if version == 4 else prefix_v6)
+    ar = [rr for rr in request.ar if rr.rtype != QTYPE.OPT]
+    opt = next((rr for rr in request.ar if rr.rtype == QTYPE.OPT), None)
+    options = [o for o in opt.rdata.options if o.code != ECS] \
+        if opt is not None and isinstance(opt.rdata, OPT) else []
+    ar.append(RR('.', QTYPE.OPT, opt.rclass if opt is not None else payload,
+                 opt.ttl if opt is not None else 0, OPT(options + [option])))
+    query = DNSUtils(request.header, list(request.questions), auth=[], ar=ar)
+    return bytes(query.pack())
+
+
+def scope(response: DNSUtils):
+    """
+        Scope prefix length of the client subnet option in response, or
+        None if the upstream did not return one
+    """
+    for rr in response.ar:
+        if rr.rtype == QTYPE.OPT:
+            option = _option(rr, ECS)
+            if option is not None and len(option.data) >= 4:
+                return option.data[3]
+    return None
+
+
+class ScopeIndex:
+    """
+        Prefix lengths cached per (name, type). Scoped answers are cached
+        under (name, type, subnet) and found by trying the client's
+        subnets from the longest cached prefix down, so a client only gets
+        answers meant for its network.
+    """
+
+    def __init__(self):
+        self._scopes = {}
+        self._lock = Lock()
+
+    def _register(self, key, network):
+        with self._lock:
+            prefixes = self._scopes.setdefault(key, {})
+            lengths = prefixes.setdefault(network.version, [])
+            if network.prefixlen not in lengths:
+                lengths.append(network.prefixlen)
+                lengths.sort(reverse=True)
+
+    def load(self, keys):
+        # rebuild the index from the scoped keys of a loaded snapshot
+        for key in keys:
+            if len(key) == 3:
+                self._register(key[:2], ipaddress.ip_network(key[2]))
+
+    def add(self, cache, key, address: str, prefix: int, record, ttl):
+        network = subnet(address, prefix)
+        cache.add(key + (str(network),), record, key[1], ttl)
+        self._register(key, network)
+
+    def get(self, cache, key, address: str):
+        """
+            Return (record, remaining seconds) for the longest cached
+            prefix covering address, or None
+        """
+        prefixes = self._scopes.get(key)
+        if not prefixes:
+            return None
+        version = ipaddress.ip_address(address).version
+        for prefix in list(prefixes.get(version, ())):
+            # a scoped miss goes on to the plain cache lookup, which counts
+            scoped = key + (str(subnet(address, prefix)),)
+            entry = cache.get_with_ttl(scoped, count=False)
+            if entry is not None:
+                cache.count(scoped, True)
+                return entry
+        return None
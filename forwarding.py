@@ -0,0 +1,54 @@
+from upstream import UpstreamPool
+
+
+def _labels(name: str):
+    # labels from the root down: www.corp.internal. -> internal, corp, www
+    name = name.lower().rstrip('.')
+    return reversed(name.split('.')) if name else ()
+
+
+class ForwardRules:
+    """
+        Conditional forwarding: a label trie maps domain suffixes to their
+        own upstream pool. route() walks the query name from the root and
+        keeps the deepest rule it passes, so matching costs one dict lookup
+        per label. Names under no rule go to the default resolver.
+    """
+
+    def __init__(self, default=None):
+        self.default = default
+        # node: [children by label, target or None]
+        self._root = [{}, None]
+
+    def add(self, suffix: str, target):
+        node = self._root
+        for label in _labels(suffix):
+            node = node[0].setdefault(label, [{}, None])
+        node[1] = target
+
+    def route(self, name: str):
+        node = self._root
+        target = node[1] or self.default
+        for label in _labels(name):
+            node = node[0].get(label)
+            if node is None:
+                break
+            if node[1] is not None:
+                target = node[1]
+        return target
+
+    @staticmethod
+    def from_config(config, default) -> 'ForwardRules':
+        """
+            config.forward_rules maps a suffix to a list of upstream
+            addresses, or to {'upstreams': [...], 'timeout': ..., 'hedge': ...}
+        """
+        rules = ForwardRules(default)
+        for suffix, rule in config.forward_rules.items():
+            if not isinstance(rule, dict):
+                rule = {'upstreams': rule}
+            rules.add(suffix, UpstreamPool(rule['upstreams'],
+                                           rule.get('timeout', config.timeout),
+                                           rule.get('hedge', config.hedge),
+                                           buffer_size=config.buffer_size))
+        return rules
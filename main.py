@@ -1,42 +1,184 @@
-from socket import socket, AF_INET, SOCK_DGRAM, timeout
-from dnsUtils import DNSUtils
+import selectors
+import signal
+import threading
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from socket import socket, AF_INET, SOCK_DGRAM
+from dnsUtils import RCODE
 from conf import Config
-from cache import Cache
+from zone import ZoneStore
+from policy import Blocklist
+from resolver import IterativeResolver, InfraCache, ROOT_HINTS
+from ratelimit import RateLimiter, ALLOW, TRUNCATE
+from wire import truncated, reply
+from querylog import log, querylog
+from control import Commands, ControlServer
+from upstream import UpstreamPool, StreamPool
+from forwarding import ForwardRules
+from peering import Peering, PeerServer
+from ecs import ScopeIndex
+from pipeline import Query
+from overload import PendingQueue
+from warmup import read_names, warm
+from special import SpecialZones
+from stages import build_pipeline, resolve_request, serve_query, serve_request, open_cache
 
 def _configure_server(config):
     server = socket(AF_INET, SOCK_DGRAM)
-    server.settimeout(2)
+    server.setblocking(False)
     server.bind(config.local_server_address)
     return server
 
-def receive_request(server, config):
-    try:
-        return server.recvfrom(config.buffer_size)
-    except timeout:
-        return receive_request(server, config)
-    except Exception as e:
-        server.close()
-        print(e)
-        exit()
+def receive_batch(server, config):
+    """
+        Drain up to config.batch_size datagrams that are already queued
+        on the (non-blocking) server socket
+    """
+    batch = []
+    while len(batch) < config.batch_size:
+        try:
+            batch.append(server.recvfrom(config.buffer_size))
+        except (BlockingIOError, InterruptedError):
+            break
+        except ConnectionResetError:
+            # ICMP port unreachable from an earlier reply (Windows)
+            continue
+    return batch
+
+def limit_batch(server, batch, limiter):
+    """
+        Drop or truncate queries from clients over their rate
+    """
+    allowed = []
+    for data, address in batch:
+        action = limiter.check(address)
+        if action == ALLOW:
+            allowed.append((data, address))
+        elif action == TRUNCATE:
+            try:
+                send_replies(server, [(truncated(data), address)])
+            except IndexError:
+                pass
+    return allowed
 
-def handle_request(data):
-    return DNSUtils.parse(data)
+def send_replies(server, replies):
+    for response, address in replies:
+        if response is None:
+            continue
+        try:
+            server.sendto(response, address)
+        except BlockingIOError:
+            # send buffer is full, the client will retry
+            pass
+
+def dispatch_batch(server, batch, config, front, back, pending):
+    """
+        Answer what the front stages can (zones, blocklist, cache hits)
+        right away and queue only the misses for the workers. When the
+        queue is full a miss is shed with config.shed_rcode, so hits keep
+        flowing while upstream is slow.
+    """
+    replies = []
+    for data, address in batch:
+        query = Query(data, address[0])
+        response = serve_query(front, query)
+        if response is not None or query.request is None:
+            replies.append((response, address))
+        elif not pending.submit(lambda q: serve_query(back, q), query,
+                                lambda r, address=address: send_replies(server, [(r, address)])):
+            log('shed', *query.key)
+            replies.append((reply(data, getattr(RCODE, config.shed_rcode)), address))
+    send_replies(server, replies)
 
 def main():
-    global server
     config = Config()
-    cache = Cache.from_dump(config.cache_dump)
+    cache = open_cache(config)
+    executor = ThreadPoolExecutor(config.workers) if config.workers else None
+    zones = ZoneStore.from_config(config)
+    blocklist = Blocklist()
+    if config.blocklist:
+        blocklist.load(config.blocklist)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda *_: blocklist.reload(config.blocklist))
+    if config.resolver == 'iterative':
+        infra = InfraCache(config.root_hints or ROOT_HINTS)
+        resolver = IterativeResolver(infra, port=config.resolver_port)
+    elif config.upstream_transport in ('tcp', 'tls'):
+        host, port = (config.upstreams or [config.forwarder_address])[0]
+        tls = config.upstream_transport == 'tls'
+        resolver = StreamPool((host, 853 if tls and port == 53 else port), config.upstream_connections,
+                              tls, config.tls_server_name, config.tls_ca_file)
+    else:
+        resolver = UpstreamPool(config.upstreams or [config.forwarder_address],
+                                config.timeout, config.hedge, buffer_size=config.buffer_size)
+    if config.forward_rules:
+        resolver = ForwardRules.from_config(config, resolver)
+    scopes = None
+    if config.ecs:
+        scopes = ScopeIndex()
+        if cache._snapshot is not None:
+            scopes.load(cache._snapshot.keys(time()))
+    peer_server = None
+    if config.peer_address:
+        resolver = Peering(config.peer_address, config.peers, resolver, config.peer_timeout,
+                           config.buffer_size, config.peer_secret)
+        peer_server = PeerServer(config.peer_address, cache, config.peers, config.peer_secret)
+        peer_server.start()
+    special = None
+    if config.special_zones:
+        # forward rules for special zones (corp or home DNS) win
+        special = SpecialZones(config.forward_rules)
+        if config.hosts:
+            special.load_hosts(config.hosts)
+    pipeline = build_pipeline(config, cache, zones, blocklist, resolver, scopes, special)
+    pending = None
+    if executor is not None:
+        front, back = pipeline.split('cache')
+        pending = PendingQueue(executor, config.max_pending, config.query_deadline)
+    if config.warmup:
+        args = (cache, read_names(config.warmup),
+                lambda request, data: resolve_request(request, data, config, resolver),
+                config.warmup_concurrency, config.warmup_rate)
+        if config.warmup_wait:
+            warm(*args)
+        else:
+            threading.Thread(target=warm, args=args, daemon=True).start()
+    if config.query_log:
+        querylog.sample = config.query_log_sample
+        querylog.open(config.query_log)
+    control = None
+    if config.control_socket:
+        control = ControlServer(config.control_socket, Commands(cache, config, pipeline, pending))
+        control.start()
+    limiter = None
+    if config.rate_limit:
+        limiter = RateLimiter(config.rate_limit, config.rate_burst, slip=config.rate_slip)
+    server = _configure_server(config)
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
     try:
         while True:
-            data, address = receive_request(server, config)
-            response = handle_request(data)
-            response, address = response.get_a().rdata, response.get_q().get_qname()
-            print(response, address)
-            server = socket(AF_INET, SOCK_DGRAM)
-            server.bind(config.forwarder_address(Cache))
-            server.sendto(str.encode(response), config.forwarder_address(Cache))
+            for _ in selector.select():
+                batch = receive_batch(server, config)
+                if limiter is not None:
+                    batch = limit_batch(server, batch, limiter)
+                if pending is not None:
+                    dispatch_batch(server, batch, config, front, back, pending)
+                else:
+                    send_replies(server, [(serve_request(pipeline, data, address[0]), address)
+                                          for data, address in batch])
     except (KeyboardInterrupt, SystemExit):
+        if executor is not None:
+            executor.shutdown()
         cache.dump_to_file(config.cache_dump)
+    finally:
+        if control is not None:
+            control.stop()
+        if peer_server is not None:
+            peer_server.stop()
+        querylog.close()
+        selector.close()
+        server.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
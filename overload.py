@@ -0,0 +1,55 @@
+import threading
+from time import monotonic
+
+
+class PendingQueue:
+    """
+        Bounded admission in front of the worker pool. At most `limit`
+        queries wait for or use a worker; past that submit() refuses and
+        the caller sheds the query. A query that waited longer than
+        `deadline` seconds is dropped before it is processed, its client
+        has already given up or retried.
+    """
+
+    def __init__(self, executor, limit=256, deadline=2.0, clock=monotonic):
+        self.executor = executor
+        self.limit = limit
+        self.deadline = deadline
+        self.clock = clock
+        self.shed = 0
+        self.expired = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, query, done) -> bool:
+        """
+            Run fn(query) on a worker and pass the result to done, or
+            return False if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.shed += 1
+            return False
+        with self._lock:
+            self._pending += 1
+        future = self.executor.submit(self._run, fn, query, self.clock())
+        future.add_done_callback(lambda f: done(f.result()))
+        return True
+
+    def _run(self, fn, query, queued):
+        try:
+            if self.clock() - queued > self.deadline:
+                with self._lock:
+                    self.expired += 1
+                return None
+            return fn(query)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'pending': self._pending, 'limit': self.limit,
+                    'shed': self.shed, 'expired': self.expired}
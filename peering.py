@@ -0,0 +1,197 @@
+import bisect
+import hashlib
+import hmac
+import socketserver
+import threading
+import zlib
+from socket import socket, AF_INET, SOCK_DGRAM, timeout
+
+from dnsUtils import DNSUtils, DNSError, QTYPE, RCODE
+from cache import get_chain, store_rrsets
+from ecs import scope
+
+
+# fills end with an HMAC-SHA256 of the message when a secret is shared
+TAG = 32
+
+
+def _point(value: str) -> int:
+    return zlib.crc32(value.encode())
+
+
+def _key(secret):
+    return secret.encode() if isinstance(secret, str) else secret
+
+
+def sign(secret, message: bytes) -> bytes:
+    return message + hmac.new(_key(secret), message, hashlib.sha256).digest()
+
+
+def verify(secret, data: bytes):
+    """
+        The message of a signed fill, or None if the tag does not match
+    """
+    message, tag = data[:-TAG], data[-TAG:]
+    if len(data) <= TAG or not hmac.compare_digest(
+            tag, hmac.new(_key(secret), message, hashlib.sha256).digest()):
+        return None
+    return message
+
+
+class HashRing:
+    """
+        Consistent hashing of names onto nodes. Every node owns `replicas`
+        points on the ring, so adding or removing a node only moves the
+        names next to its points.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        self._ring = sorted((_point(f'{node[0]}:{node[1]}#{i}'), node)
+                            for node in nodes for i in range(replicas))
+        self._points = [point for point, _ in self._ring]
+
+    def owner(self, name: str):
+        if not self._ring:
+            return None
+        i = bisect.bisect(self._points, _point(name.lower())) % len(self._ring)
+        return self._ring[i][1]
+
+
+class Peering:
+    """
+        Ask the sibling that owns a name on the hash ring before going
+        upstream. Siblings answer from their caches only, so a peer lookup
+        costs one round trip on the local network and gives up after
+        `timeout`. Names owned by this node go straight to `default`.
+        When this node had to go upstream for another node's name, it
+        hands the response to the owner so the next sibling asking finds
+        it cached, signed with `secret` if one is shared.
+    """
+
+    def __init__(self, address, peers, default=None, timeout=0.02, buffer_size=4096, secret=None):
+        self.address = tuple(address)
+        self.default = default
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.secret = secret
+        self.ring = HashRing({self.address} | {tuple(peer) for peer in peers})
+        self.hits = 0
+        self.misses = 0
+
+    def _owner(self, request):
+        owner = self.ring.owner(str(request.q.qname))
+        return None if owner == self.address else owner
+
+    def lookup(self, request, data: bytes):
+        """
+            Return the owner's cached response to data, or None
+        """
+        owner = self._owner(request)
+        if owner is None:
+            return None
+        peer = socket(AF_INET, SOCK_DGRAM)
+        peer.settimeout(self.timeout)
+        try:
+            peer.sendto(data, owner)
+            response, _ = peer.recvfrom(self.buffer_size)
+        except (timeout, OSError):
+            self.misses += 1
+            return None
+        finally:
+            peer.close()
+        if response[:2] != data[:2] or response[3] & 0x0f != RCODE.NOERROR:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    def fill(self, request, response: bytes):
+        owner = self._owner(request)
+        if owner is None:
+            return
+        if self.secret is not None:
+            response = sign(self.secret, response)
+        peer = socket(AF_INET, SOCK_DGRAM)
+        try:
+            peer.sendto(response, owner)
+        except OSError:
+            pass
+        finally:
+            peer.close()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        data, sock = self.request
+        response = self.server.answer(data, self.client_address[0])
+        if response is not None:
+            sock.sendto(response, self.client_address)
+
+
+class PeerServer(socketserver.UDPServer):
+    """
+        Answers sibling queries from the local cache. Anything not cached
+        gets REFUSED at once, so the asking node does not wait out its
+        deadline before going upstream. Responses (fills) are stored in
+        the cache only when they come from a sibling host, are for a
+        name this node owns on the ring and, with a shared `secret`,
+        carry a valid tag. Only the question's chain is stored.
+    """
+
+    def __init__(self, address, cache, peers=(), secret=None):
+        self.cache = cache
+        self.address = tuple(address)
+        self.hosts = {peer[0] for peer in peers}
+        self.ring = HashRing({self.address} | {tuple(peer) for peer in peers})
+        self.secret = secret
+        self.rejected = 0
+        super().__init__(self.address, _Handler)
+
+    def answer(self, data: bytes, host: str = None):
+        if len(data) > 2 and data[2] & 0x80:
+            self.store(data, host)
+            return None
+        try:
+            request = DNSUtils.parse(data)
+        except DNSError:
+            return None
+        q = request.q
+        reply = request.reply(aa=0)
+        chain, missing = get_chain(self.cache, (str(q.qname).lower(), QTYPE.get(q.qtype)))
+        if chain and missing is None:
+            reply.add_answer(*chain)
+        else:
+            reply.header.rcode = RCODE.REFUSED
+        return reply.pack()
+
+    def store(self, data: bytes, host: str):
+        if host not in self.hosts:
+            self.rejected += 1
+            return
+        if self.secret is not None:
+            data = verify(self.secret, data)
+            if data is None:
+                self.rejected += 1
+                return
+        try:
+            response = DNSUtils.parse(data)
+        except DNSError:
+            self.rejected += 1
+            return
+        q = response.q
+        # answers scoped to a client subnet are not shared
+        if self.ring.owner(str(q.qname)) != self.address or response.header.rcode != RCODE.NOERROR \
+                or not response.rr or scope(response):
+            self.rejected += 1
+            return
+        store_rrsets(self.cache, q.qname, q.qtype, response.rr)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,87 @@
+from threading import Lock
+from time import perf_counter
+
+
+class Query:
+    """
+        State shared by the stages handling one datagram, decoded once:
+        `request` is the parsed DNSUtils, `name` the query name as sent,
+        `qtype` its numeric type and `key` the cache key; `response` is
+        the reply so far.
+    """
+    __slots__ = ('data', 'client', 'request', 'name', 'qtype', 'key',
+                 'chain', 'missing', 'response')
+
+    def __init__(self, data, client=None):
+        self.data = data
+        self.client = client
+        self.request = None
+        self.name = None
+        self.qtype = None
+        self.key = None
+        self.chain = None
+        self.missing = None
+        self.response = None
+
+
+class StageStats:
+    __slots__ = ('calls', 'answered', 'seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.answered = 0
+        self.seconds = 0.0
+
+
+class Pipeline:
+    """
+        Named stages run in order over a Query. A stage returns None to
+        pass the query on, or the reply to finish early (a cache hit skips
+        the upstream and store stages). Later stages may also leave their
+        result in query.response. Every stage is timed and can be replaced
+        by name.
+    """
+
+    def __init__(self, stages, stats=None, lock=None):
+        self.stages = list(stages)
+        self._stats = stats if stats is not None else {name: StageStats() for name, _ in self.stages}
+        self._lock = lock or Lock()
+
+    def replace(self, name: str, stage):
+        self.stages = [(n, stage if n == name else s) for n, s in self.stages]
+
+    def split(self, name: str):
+        """
+            Return the stages up to and including `name` and the ones
+            after it as two pipelines sharing these stats, so the front can
+            run on the receiving thread and the rest on workers
+        """
+        i = [n for n, _ in self.stages].index(name) + 1
+        return (Pipeline(self.stages[:i], self._stats, self._lock),
+                Pipeline(self.stages[i:], self._stats, self._lock))
+
+    def run(self, data, client=None):
+        return self.process(Query(data, client))
+
+    def process(self, query: Query):
+        for name, stage in self.stages:
+            start = perf_counter()
+            response = stage(query)
+            elapsed = perf_counter() - start
+            stats = self._stats[name]
+            with self._lock:
+                stats.calls += 1
+                stats.seconds += elapsed
+                if response is not None:
+                    stats.answered += 1
+            if response is not None:
+                query.response = response
+                break
+        return query.response
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: {'calls': s.calls,
+                           'answered': s.answered,
+                           'avg_us': round(s.seconds / s.calls * 1e6, 1) if s.calls else 0}
+                    for name, s in self._stats.items()}
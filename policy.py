@@ -0,0 +1,102 @@
+import socket
+import struct
+import threading
+
+from wire import question_end, reply
+
+NXDOMAIN = b''
+
+
+class Blocklist:
+    """
+        Sinkhole / rewrite rules for query names.
+
+        Rules are stored as two flat dicts keyed by the lower-cased name:
+        exact names and wildcard suffixes ("*.example.com"). A lookup probes
+        the name itself and then each parent suffix, so it costs one hash
+        probe per label, and a million rules cost one dict entry each.
+        The value is the packed rewrite address or NXDOMAIN.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._rules = ({}, {})
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        exact, wildcard = self._rules
+        return len(exact) + len(wildcard)
+
+    @staticmethod
+    def _parse(lines):
+        exact, wildcard = {}, {}
+        addresses = {}
+        for line in lines:
+            line = line.split('#', 1)[0].split()
+            if not line:
+                continue
+            if len(line) > 1 and (':' in line[0] or line[0].replace('.', '').isdigit()):
+                # hosts format: "0.0.0.0 ads.example.com"
+                address, name = line[0], line[1]
+            else:
+                name, address = line[0], line[1] if len(line) > 1 else None
+            if address in (None, '0.0.0.0', '::'):
+                action = NXDOMAIN
+            else:
+                family = socket.AF_INET6 if ':' in address else socket.AF_INET
+                packed = socket.inet_pton(family, address)
+                action = addresses.setdefault(packed, packed)
+            name = name.lower().rstrip('.')
+            if name.startswith('*.'):
+                wildcard[name[2:]] = action
+            else:
+                exact[name] = action
+        return exact, wildcard
+
+    def load(self, filename: str):
+        with open(filename) as f:
+            rules = self._parse(f)
+        # swap the whole rule set in one assignment, lookups never block
+        self._rules = rules
+        print(f'Blocklist loaded: {len(self)} rules.')
+
+    def reload(self, filename: str):
+        """
+            Rebuild the rules in a background thread, queries keep being
+            checked against the old set until the new one is ready
+        """
+        def worker():
+            with self._lock:
+                self.load(filename)
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+    def check(self, name: str):
+        """
+            Return the action for name or None if it is not listed
+        """
+        exact, wildcard = self._rules
+        name = name.lower().rstrip('.')
+        action = exact.get(name)
+        if action is not None:
+            return action
+        i = name.find('.')
+        while i != -1:
+            action = wildcard.get(name[i + 1:])
+            if action is not None:
+                return action
+            i = name.find('.', i + 1)
+        return None
+
+    def respond(self, data: bytes, action: bytes) -> bytes:
+        """
+            Sinkhole response for the query in data
+        """
+        if action == NXDOMAIN:
+            return reply(data, 3)
+        qtype, = struct.unpack_from("!H", data, question_end(data) - 4)
+        rtype = 1 if len(action) == 4 else 28
+        if qtype != rtype:
+            return reply(data, 0)
+        return reply(data, 0, [(rtype, action)], self.ttl)
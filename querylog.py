@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from time import time
+
+
+class QueryLog:
+    """
+        Structured query log. Callers only store a tuple into a
+        preallocated ring buffer; a background thread formats the events
+        as jsonl and appends them to a file that is rotated by size.
+        When the ring is full new events are dropped (and counted) rather
+        than blocking the request path. With sample=N only every N-th
+        event is recorded.
+    """
+
+    def __init__(self, capacity=65536, sample=1):
+        self.capacity = capacity
+        self.sample = sample
+        self.dropped = 0
+        self._ring = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._seen = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def open(self, filename, max_bytes=64 * 1024 * 1024, backups=5, interval=0.5):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        self._file = open(filename, 'a')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def log(self, event, name='', qtype='', detail=None):
+        if self._file is None:
+            return
+        with self._lock:
+            self._seen += 1
+            if self._seen % self.sample:
+                return
+            if self._head - self._tail >= self.capacity:
+                self.dropped += 1
+                return
+            self._ring[self._head % self.capacity] = (time(), event, name, qtype, detail)
+            self._head += 1
+
+    def _drain(self):
+        with self._lock:
+            head = self._head
+        events = []
+        for i in range(self._tail, head):
+            events.append(self._ring[i % self.capacity])
+        with self._lock:
+            self._tail = head
+        return events
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.filename}.{i}'):
+                os.replace(f'{self.filename}.{i}', f'{self.filename}.{i + 1}')
+        os.replace(self.filename, f'{self.filename}.1')
+        self._file = open(self.filename, 'a')
+
+    def _write(self, events):
+        lines = []
+        for t, event, name, qtype, detail in events:
+            record = {'t': round(t, 3), 'e': event, 'n': name, 'q': qtype}
+            if detail is not None:
+                record['d'] = detail
+            lines.append(json.dumps(record, separators=(',', ':')))
+        if lines:
+            self._file.write('\n'.join(lines) + '\n')
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _writer(self):
+        while not self._stop.wait(self.interval):
+            self._write(self._drain())
+        self._write(self._drain())
+
+
+# process wide log, records nothing until open() is called
+querylog = QueryLog()
+
+
+def log(event, name='', qtype='', detail=None):
+    querylog.log(event, name, qtype, detail)
@@ -0,0 +1,56 @@
+import socket
+from collections import OrderedDict
+from time import monotonic
+
+ALLOW = 0
+DROP = 1
+TRUNCATE = 2
+
+
+class RateLimiter:
+    """
+        Per source prefix token buckets in the style of RFC RRL.
+        Buckets live in a bounded LRU map: each check is a dict lookup and
+        a move to the end, and the least recently seen prefix is evicted
+        when the map is full. Every `slip`-th limited query is answered
+        with TC instead of being dropped, so real clients can retry over TCP.
+    """
+
+    def __init__(self, rate=20, burst=40, max_clients=65536, slip=2,
+                 ipv4_prefix=24, ipv6_prefix=56, clock=monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.slip = slip
+        self._prefix_bytes = {socket.AF_INET: ipv4_prefix // 8,
+                              socket.AF_INET6: ipv6_prefix // 8}
+        self._clock = clock
+        self._buckets = OrderedDict()
+
+    def _prefix(self, address):
+        family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+        return socket.inet_pton(family, address[0])[:self._prefix_bytes[family]]
+
+    def check(self, address) -> int:
+        """
+            Return ALLOW, DROP or TRUNCATE for a query from address
+        """
+        key = self._prefix(address)
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)
+            # tokens, last refill, limited queries
+            bucket = self._buckets[key] = [self.burst, now, 0]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return ALLOW
+        bucket[2] += 1
+        if self.slip and bucket[2] % self.slip == 0:
+            return TRUNCATE
+        return DROP
@@ -0,0 +1,197 @@
+from socket import timeout as socket_timeout
+from threading import Lock
+from time import time
+
+from dnslib.label import DNSLabel
+from dnsUtils import DNSUtils, DNSHeader, DNSQuestion, DNSError, QTYPE, RCODE
+from cache import MAX_CHAIN
+
+ROOT_HINTS = [
+    ('a.root-servers.net.', '198.41.0.4'),
+    ('b.root-servers.net.', '170.247.170.2'),
+    ('c.root-servers.net.', '192.33.4.12'),
+    ('d.root-servers.net.', '199.7.91.13'),
+    ('e.root-servers.net.', '192.203.230.10'),
+    ('f.root-servers.net.', '192.5.5.241'),
+    ('g.root-servers.net.', '192.112.36.4'),
+    ('h.root-servers.net.', '198.97.190.53'),
+    ('i.root-servers.net.', '192.36.148.17'),
+    ('j.root-servers.net.', '192.58.128.30'),
+    ('k.root-servers.net.', '193.0.14.129'),
+    ('l.root-servers.net.', '199.7.83.42'),
+    ('m.root-servers.net.', '202.12.27.33'),
+]
+
+
+class ResolverError(Exception):
+    pass
+
+
+def _under(name: DNSLabel, zone: DNSLabel):
+    # DNSLabel.matchSuffix does not match the root label
+    return not zone.label or name.matchSuffix(zone)
+
+
+def _chain(rrs: list, name: DNSLabel, qtype: int):
+    """
+        The RRs answering name from rrs, following CNAMEs. Returns (chain,
+        target) where target is the CNAME target still to resolve, or None
+        when the chain is complete (or empty: NODATA / NXDOMAIN).
+    """
+    chain = []
+    for _ in range(MAX_CHAIN):
+        records = [rr for rr in rrs if rr.rname == name and rr.rtype == qtype]
+        if records:
+            return chain + records, None
+        cname = [rr for rr in rrs if rr.rname == name and rr.rtype == QTYPE.CNAME]
+        if not cname:
+            return chain, name if chain else None
+        chain += cname[:1]
+        name = cname[0].rdata.label
+    return chain, None
+
+
+class InfraCache:
+    """
+        Delegations learned from referrals: zone cut -> NS names and
+        NS name -> addresses, each with the expiry of its RRset.
+        The root hints never expire.
+    """
+
+    def __init__(self, hints=ROOT_HINTS):
+        self._ns = {}
+        self._addresses = {}
+        self._lock = Lock()
+        root = DNSLabel('.')
+        self._ns[root] = (float('inf'), [DNSLabel(name) for name, _ in hints])
+        for name, address in hints:
+            self._addresses.setdefault(DNSLabel(name), (float('inf'), []))[1].append(address)
+
+    def add_delegation(self, zone: DNSLabel, ns: list, glue: list, bailiwick: DNSLabel):
+        """
+            Cache a referral to zone from a server authoritative for
+            bailiwick; glue outside bailiwick is not trusted
+        """
+        now = time()
+        names = [rr.rdata.label for rr in ns]
+        with self._lock:
+            self._ns[zone] = (now + min(rr.ttl for rr in ns), names)
+            for rr in glue:
+                if rr.rtype == QTYPE.A and rr.rname in names and _under(rr.rname, bailiwick):
+                    expiry, addresses = self._addresses.get(rr.rname, (0, []))
+                    if expiry <= now:
+                        addresses = []
+                    if repr(rr.rdata) not in addresses:
+                        addresses.append(repr(rr.rdata))
+                    self._addresses[rr.rname] = (now + rr.ttl, addresses)
+
+    def add_address(self, name: DNSLabel, addresses: list, ttl: int):
+        with self._lock:
+            self._addresses[name] = (time() + ttl, addresses)
+
+    def nameservers(self, zone: DNSLabel):
+        """
+            Return (ns names, known addresses) for a live zone cut
+        """
+        now = time()
+        with self._lock:
+            expiry, names = self._ns.get(zone, (0, []))
+            if expiry <= now:
+                return [], []
+            addresses = []
+            for name in names:
+                expiry, known = self._addresses.get(name, (0, []))
+                if expiry > now:
+                    addresses.extend(known)
+            return names, addresses
+
+    def closest(self, qname: DNSLabel):
+        """
+            Deepest zone cut above qname with live NS records
+        """
+        labels = qname.label
+        for i in range(len(labels) + 1):
+            zone = DNSLabel(labels[i:])
+            names, addresses = self.nameservers(zone)
+            if names:
+                return zone, names, addresses
+        raise ResolverError('No root hints')
+
+
+class IterativeResolver:
+    """
+        Resolve from the deepest cached zone cut by following referrals,
+        caching the NS RRsets and glue of every referral on the way
+    """
+
+    def __init__(self, infra: InfraCache = None, port=53, timeout=2, max_referrals=16):
+        self.infra = infra or InfraCache()
+        self.port = port
+        self.timeout = timeout
+        self.max_referrals = max_referrals
+
+    def _query(self, q: DNSQuestion, addresses: list):
+        query = DNSUtils(DNSHeader(rd=0), q=DNSQuestion(q.qname, q.qtype, q.qclass))
+        for address in addresses:
+            try:
+                response = DNSUtils.parse(query.send(address, self.port, timeout=self.timeout))
+            except (OSError, socket_timeout, DNSError):
+                continue
+            if response.header.id == query.header.id:
+                return response
+        return None
+
+    def _lookup_ns(self, names: list, depth: int):
+        # glueless delegation: resolve the NS names themselves
+        for name in names:
+            response = self.resolve(DNSQuestion(name, QTYPE.A), depth + 1)
+            if response is None:
+                continue
+            addresses = [repr(rr.rdata) for rr in response.rr if rr.rtype == QTYPE.A]
+            if addresses:
+                self.infra.add_address(name, addresses, min(rr.ttl for rr in response.rr))
+                return addresses
+        return []
+
+    def resolve(self, q: DNSQuestion, depth=0):
+        """
+            Return the final response for q, or None if no server answered.
+            A CNAME is followed into other zones, up to MAX_CHAIN links; the
+            response then holds the whole chain and the target's rcode.
+        """
+        name = q.qname
+        answer = []
+        for _ in range(MAX_CHAIN):
+            response = self._resolve(DNSQuestion(name, q.qtype, q.qclass), depth)
+            if response is None:
+                return None
+            chain, name = _chain(response.rr, name, q.qtype)
+            answer += chain
+            if name is None or response.header.rcode != RCODE.NOERROR:
+                response.rr = answer
+                return response
+        return None
+
+    def _resolve(self, q: DNSQuestion, depth):
+        if depth > 2:
+            return None
+        zone, names, addresses = self.infra.closest(q.qname)
+        for _ in range(self.max_referrals):
+            if not addresses:
+                addresses = self._lookup_ns(names, depth)
+            response = self._query(q, addresses)
+            if response is None:
+                return None
+            if response.rr or response.header.aa or response.header.rcode != RCODE.NOERROR:
+                return response
+            ns = [rr for rr in response.auth if rr.rtype == QTYPE.NS]
+            if not ns:
+                return response
+            cut = ns[0].rname
+            # only follow referrals that move closer to qname
+            if cut == zone or not _under(q.qname, cut) or not _under(cut, zone):
+                return response
+            self.infra.add_delegation(cut, ns, response.ar, zone)
+            zone = cut
+            names, addresses = self.infra.nameservers(cut)
+        return None
@@ -0,0 +1,124 @@
+import argparse
+import json
+import tracemalloc
+
+from cache import Cache
+from dnsUtils import RR, A
+from sketch import TinyLFU
+import conf
+
+POLICIES = ('lru', 'tinylfu')
+
+
+class VirtualClock:
+    """
+        Replaces time() in the cache: the simulator moves it to the
+        timestamp of every replayed query
+    """
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def load_trace(filenames):
+    """
+        Read query log files (oldest first) into a list of (t, key) queries
+        and the last upstream TTL seen for every key. Keys are interned so
+        repeated names share one tuple.
+    """
+    queries = []
+    ttls = {}
+    keys = {}
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                event = json.loads(line)
+                key = (event['n'], event['q'])
+                key = keys.setdefault(key, key)
+                if event['e'] in ('hit', 'miss'):
+                    queries.append((event['t'], key))
+                elif event['e'] == 'cache_add' and 'd' in event:
+                    ttls[key] = event['d']
+    queries.sort(key=lambda query: query[0])
+    return queries, ttls
+
+
+def record_bytes(samples: int = 2000) -> float:
+    """
+        Measured heap cost of one cached single-RR record, key and expiry
+    """
+    cache = Cache()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(samples):
+        name = f'host{i}.example.com.'
+        cache.add((name, 'A'), [RR(name, 1, 1, 60, A('192.0.2.1'))], 'A', 60)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / samples
+
+
+def simulate(queries, ttls, policy=None, size=None, default_ttl=conf.TTL,
+             min_ttl=0, max_ttl=None, per_record=None):
+    """
+        Replay queries against a Cache on a virtual clock. A miss counts as
+        one upstream query and stores the key with its logged TTL,
+        clamped to [min_ttl, max_ttl].
+    """
+    clock = VirtualClock(queries[0][0] if queries else 0.0)
+    cache = Cache(max_records=size, admission=policy == 'tinylfu', clock=clock)
+    record = []
+    upstream = 0
+    peak = 0
+    for t, key in queries:
+        clock.now = t
+        if cache.get_with_ttl(key) is None:
+            upstream += 1
+            ttl = max(min_ttl, ttls.get(key, default_ttl))
+            if max_ttl is not None:
+                ttl = min(ttl, max_ttl)
+            if ttl > 0:
+                cache.add(key, record, key[1], ttl)
+                peak = max(peak, len(cache._cache))
+    duration = max(1.0, queries[-1][0] - queries[0][0]) if queries else 1.0
+    memory = peak * (per_record or record_bytes())
+    if isinstance(cache.admission, TinyLFU):
+        memory += cache.admission.sketch.width * cache.admission.sketch.depth
+    return {'policy': policy or 'unbounded',
+            'size': size,
+            'hit_ratio': cache.hits / max(1, cache.hits + cache.misses),
+            'peak_records': peak,
+            'memory_mb': memory / 2 ** 20,
+            'upstream_qps': upstream / duration}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a query log against cache policies')
+    parser.add_argument('logs', nargs='+', help='query log files, oldest first')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated max_records values')
+    parser.add_argument('--policies', default=','.join(POLICIES))
+    parser.add_argument('--default-ttl', type=int, default=conf.TTL,
+                        help='TTL for keys the log has no cache_add for')
+    parser.add_argument('--min-ttl', type=int, default=0)
+    parser.add_argument('--max-ttl', type=int, default=None)
+    args = parser.parse_args()
+
+    queries, ttls = load_trace(args.logs)
+    print(f'{len(queries)} queries, {len(ttls)} keys with a logged TTL')
+    per_record = record_bytes()
+    runs = [(None, None)] + [(policy, int(size)) for size in args.sizes.split(',')
+                             for policy in args.policies.split(',')]
+    print(f'{"policy":>10} {"size":>8} {"hit ratio":>10} {"records":>8} {"memory MB":>10} {"upstream qps":>13}')
+    for policy, size in runs:
+        result = simulate(queries, ttls, policy, size, args.default_ttl,
+                          args.min_ttl, args.max_ttl, per_record)
+        print(f'{result["policy"]:>10} {str(result["size"] or "-"):>8} {result["hit_ratio"]:>10.3f} '
+              f'{result["peak_records"]:>8} {result["memory_mb"]:>10.2f} {result["upstream_qps"]:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import heapq
+from array import array
+from threading import Lock
+
+MASK = (1 << 64) - 1
+# byte -> byte >> 1, halves a whole row in one bytes.translate()
+HALVE = bytes(i >> 1 for i in range(256))
+
+
+class CountMinSketch:
+    """
+        Frequency estimates in fixed memory: `depth` rows of `width`
+        saturating 4-bit-style counters (capped at 15). reset() halves
+        every counter so old popularity fades.
+    """
+
+    def __init__(self, width: int, depth: int = 4, limit: int = 15):
+        self.width = max(16, width)
+        self.depth = depth
+        self.limit = limit
+        self._rows = [array('B', bytes(self.width)) for _ in range(depth)]
+
+    def _indexes(self, key):
+        # double hashing: row i uses h1 + i * h2
+        h1 = hash(key) & MASK
+        h2 = (h1 >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def increment(self, key) -> int:
+        indexes = self._indexes(key)
+        current = min(row[i] for row, i in zip(self._rows, indexes))
+        if current < self.limit:
+            # conservative update: only raise the counters holding the minimum
+            for row, i in zip(self._rows, indexes):
+                if row[i] == current:
+                    row[i] = current + 1
+        return current + 1
+
+    def estimate(self, key) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def reset(self):
+        self._rows = [array('B', row.tobytes().translate(HALVE)) for row in self._rows]
+
+
+class TinyLFU:
+    """
+        Admission filter: a new key only replaces the eviction victim if it
+        has been seen more often recently. Counts are halved every
+        `sample` recorded accesses (default 10 x capacity).
+    """
+
+    def __init__(self, capacity: int, sample: int = None):
+        self.sketch = CountMinSketch(capacity * 2)
+        self.sample = sample or capacity * 10
+        self._additions = 0
+
+    def record(self, key):
+        self.sketch.increment(key)
+        self._additions += 1
+        if self._additions >= self.sample:
+            self.sketch.reset()
+            self._additions //= 2
+
+    def admit(self, candidate, victim) -> bool:
+        return self.sketch.estimate(candidate) > self.sketch.estimate(victim)
+
+
+class TopK:
+    """
+        Space-Saving top-k: at most k counters. An unseen key takes over
+        the smallest counter and inherits its count as the error bound,
+        so memory stays constant however many distinct keys are seen.
+    """
+
+    def __init__(self, k: int = 32):
+        self.k = k
+        self._counts = {}
+        self._errors = {}
+        # (count, key) min-heap; entries go stale as counts grow and are
+        # refreshed lazily when they reach the top
+        self._heap = []
+        self._lock = Lock()
+
+    def add(self, key):
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts[key] = count + 1
+                return
+            if len(self._counts) < self.k:
+                self._counts[key] = 1
+                self._errors[key] = 0
+                heapq.heappush(self._heap, (1, key))
+                return
+            while True:
+                count, victim = self._heap[0]
+                current = self._counts[victim]
+                if current == count:
+                    break
+                heapq.heapreplace(self._heap, (current, victim))
+            heapq.heapreplace(self._heap, (count + 1, key))
+            del self._counts[victim]
+            del self._errors[victim]
+            self._counts[key] = count + 1
+            self._errors[key] = count
+
+    def top(self, n: int = None):
+        """
+            Return up to n (key, count, error) triples, most frequent first
+        """
+        with self._lock:
+            items = [(key, count, self._errors[key]) for key, count in self._counts.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items[:n]
+
+
+class HeavyHitters:
+    """
+        Most queried (name, type) keys, counted apart for cache hits and misses
+    """
+
+    def __init__(self, k: int = 32):
+        self.hits = TopK(k)
+        self.misses = TopK(k)
+
+    def record(self, hit: bool, key):
+        (self.hits if hit else self.misses).add(key)
+
+    def top(self, hit: bool = False, n: int = None):
+        return [(key, count) for key, count, _ in (self.hits if hit else self.misses).top(n)]
+
+    def stats(self, n: int = None) -> dict:
+        def rows(top_k):
+            return [{'name': key[0], 'type': key[1], 'count': count, 'error': error}
+                    for key, count, error in top_k.top(n)]
+        return {'hit': rows(self.hits), 'miss': rows(self.misses)}
+
+
+# process wide tracker shared by the request paths and the stats output
+hitters = HeavyHitters()
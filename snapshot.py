@@ -0,0 +1,143 @@
+import mmap
+import os
+import struct
+import zlib
+
+from dnslib.label import DNSBuffer
+from dnsUtils import RR
+
+MAGIC = b'DNSC'
+VERSION = 1
+
+# magic, version, record count, index buckets
+HEADER = struct.Struct("!4sHII")
+# expiry, key length, record type length, rr count, rr blob length
+RECORD = struct.Struct("!dHBHI")
+BUCKET = struct.Struct("!I")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _key(tup) -> bytes:
+    return '\x00'.join(tup).encode()
+
+
+def _pack_rrs(rrs) -> bytes:
+    buffer = DNSBuffer()
+    for rr in rrs:
+        rr.pack(buffer)
+    return bytes(buffer.data)
+
+
+def write_snapshot(filename: str, entries):
+    """
+        Write (key, expiry, record_type, rrs) entries as
+        header | hash index | record table
+        The file is written aside and renamed, so readers never see a
+        half written snapshot.
+    """
+    records = []
+    for tup, expiry, record_type, rrs in entries:
+        records.append((_key(tup), expiry, record_type.encode(), len(rrs), _pack_rrs(rrs)))
+    buckets = max(1, len(records) * 2)
+    index = [0] * buckets
+    offset = HEADER.size + buckets * BUCKET.size
+    body = []
+    for key, expiry, record_type, count, blob in records:
+        slot = zlib.crc32(key) % buckets
+        while index[slot]:
+            slot = (slot + 1) % buckets
+        index[slot] = offset
+        record = RECORD.pack(expiry, len(key), len(record_type), count, len(blob)) + \
+            key + record_type + blob
+        body.append(record)
+        offset += len(record)
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), buckets))
+        f.write(b''.join(BUCKET.pack(o) for o in index))
+        f.write(b''.join(body))
+    os.replace(tmp, filename)
+
+
+class Snapshot:
+    """
+        Read-only view of a snapshot file. The file is mmap'ed and records
+        are decoded only when looked up.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError('Empty snapshot')
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise SnapshotError('Truncated snapshot')
+        magic, version, self.count, self._buckets = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SnapshotError('Unknown snapshot format')
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, offset):
+        expiry, key_len, type_len, count, blob_len = RECORD.unpack_from(self._map, offset)
+        start = offset + RECORD.size
+        key = self._map[start:start + key_len]
+        start += key_len
+        record_type = self._map[start:start + type_len].decode()
+        start += type_len
+        return key, expiry, record_type, count, start, blob_len
+
+    def _rrs(self, count, start, length):
+        buffer = DNSBuffer(self._map[start:start + length])
+        return [RR.parse(buffer) for _ in range(count)]
+
+    def get(self, tup, now):
+        """
+            Return (expiry, record_type, rrs) for tup, or None if it is
+            missing or expired
+        """
+        key = _key(tup)
+        slot = zlib.crc32(key) % self._buckets
+        while True:
+            offset, = BUCKET.unpack_from(self._map, HEADER.size + slot * BUCKET.size)
+            if not offset:
+                return None
+            record_key, expiry, record_type, count, start, length = self._record(offset)
+            if record_key == key:
+                if expiry <= now:
+                    return None
+                return expiry, record_type, self._rrs(count, start, length)
+            slot = (slot + 1) % self._buckets
+
+    def keys(self, now):
+        """
+            Iterate over the live keys without decoding their records
+        """
+        offset = HEADER.size + self._buckets * BUCKET.size
+        for _ in range(self.count):
+            key, expiry, record_type, count, start, length = self._record(offset)
+            if expiry > now:
+                yield tuple(key.decode().split('\x00'))
+            offset = start + length
+
+    def items(self, now):
+        """
+            Iterate over the live (key, expiry, record_type, rrs) entries
+        """
+        offset = HEADER.size + self._buckets * BUCKET.size
+        for _ in range(self.count):
+            key, expiry, record_type, count, start, length = self._record(offset)
+            if expiry > now:
+                yield tuple(key.decode().split('\x00')), expiry, record_type, \
+                    self._rrs(count, start, length)
+            offset = start + length
@@ -0,0 +1,105 @@
+import ipaddress
+
+from wire import reply
+
+NOERROR = 0
+NXDOMAIN = 3
+A, PTR, AAAA, ANY = 1, 12, 28, 255
+
+# RFC 6303 locally served reverse zones and RFC 6761 / 6762 / 7686 / 8375
+# special-use names: never sent upstream
+ZONES = {
+    # RFC 1918, loopback, this network, link-local, documentation, broadcast
+    '10.in-addr.arpa', '168.192.in-addr.arpa', '127.in-addr.arpa',
+    '0.in-addr.arpa', '254.169.in-addr.arpa', '2.0.192.in-addr.arpa',
+    '100.51.198.in-addr.arpa', '113.0.203.in-addr.arpa',
+    '255.255.255.255.in-addr.arpa',
+    *(f'{i}.172.in-addr.arpa' for i in range(16, 32)),
+    # ULA, link-local, documentation, loopback and unspecified IPv6
+    'd.f.ip6.arpa', '8.e.f.ip6.arpa', '9.e.f.ip6.arpa', 'a.e.f.ip6.arpa',
+    'b.e.f.ip6.arpa', '8.b.d.0.1.0.0.2.ip6.arpa',
+    '1' + '.0' * 31 + '.ip6.arpa', '0' + '.0' * 31 + '.ip6.arpa',
+    'localhost', 'invalid', 'local', 'onion', 'home.arpa',
+}
+
+LOCALHOST = 'localhost'
+
+
+def _encode(name: str) -> bytes:
+    return b''.join(bytes([len(label)]) + label.encode()
+                    for label in name.rstrip('.').split('.') if label) + b'\x00'
+
+
+class SpecialZones:
+    """
+        Answers for special-use names without going upstream: localhost
+        and the loopback reverse names are synthesized, names in a hosts
+        map get their addresses and PTRs, anything else under a special
+        zone is NXDOMAIN. Names under a `forwarded` suffix (a forward rule
+        sending e.g. 10.in-addr.arpa or home.arpa to a local server) are
+        left to that rule; the hosts map still answers for them.
+    """
+
+    def __init__(self, forwarded=()):
+        self._forwarded = {name.lower().strip('.') for name in forwarded}
+        # name -> [(rtype, rdata)], reverse name -> PTR rdata
+        self._hosts = {LOCALHOST: [(A, ipaddress.ip_address('127.0.0.1').packed),
+                                   (AAAA, ipaddress.ip_address('::1').packed)]}
+        self._reverse = {}
+
+    def load_hosts(self, filename: str):
+        """
+            Add "address name [alias...]" lines, /etc/hosts style
+        """
+        count = 0
+        with open(filename) as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split()
+                if len(fields) < 2:
+                    continue
+                try:
+                    address = ipaddress.ip_address(fields[0])
+                except ValueError:
+                    continue
+                rtype = A if address.version == 4 else AAAA
+                for name in fields[1:]:
+                    self._hosts.setdefault(name.lower().rstrip('.'), []).append((rtype, address.packed))
+                # the first name is the canonical one for the PTR
+                self._reverse.setdefault(address.reverse_pointer, _encode(fields[1]))
+                count += 1
+        print(f'Hosts loaded: {count} addresses.')
+
+    def _ptr(self, name: str):
+        if name in self._reverse:
+            return self._reverse[name]
+        if name.endswith('.127.in-addr.arpa') or name == '1' + '.0' * 31 + '.ip6.arpa':
+            return _encode(LOCALHOST)
+        return None
+
+    @staticmethod
+    def _covers(suffixes, name: str) -> bool:
+        labels = name.split('.')
+        return any('.'.join(labels[i:]) in suffixes for i in range(len(labels)))
+
+    def _special(self, name: str) -> bool:
+        return self._covers(ZONES, name)
+
+    def answer(self, data: bytes, name: str, qtype: int):
+        """
+            Response bytes for the query in data, or None if the name is
+            not special and not in the hosts map
+        """
+        name = name.lower().rstrip('.')
+        if name.endswith('.' + LOCALHOST):
+            name = LOCALHOST
+        records = self._hosts.get(name)
+        if records is not None:
+            return reply(data, NOERROR, [r for r in records if qtype in (r[0], ANY)])
+        if self._covers(self._forwarded, name):
+            return None
+        ptr = self._ptr(name)
+        if ptr is not None:
+            return reply(data, NOERROR, [(PTR, ptr)] if qtype in (PTR, ANY) else [])
+        if self._special(name):
+            return reply(data, NXDOMAIN)
+        return None
@@ -0,0 +1,202 @@
+import struct
+from dnsUtils import DNSUtils, DNSQuestion, DNSError, QTYPE, RR
+from cache import Cache, ShardedCache, store_rrsets, get_chain
+from wire import question_end
+from querylog import log
+from upstream import UpstreamPool, StreamPool
+from forwarding import ForwardRules
+from peering import Peering
+from ecs import with_subnet, scope
+from pipeline import Pipeline, Query
+from sketch import hitters
+
+# The server core shared by main.py and DNSServerMini: the stages work on
+# the wire bytes of a datagram and the Query decoded from them once.
+
+def resolve_request(request, data, config, resolver):
+    if isinstance(resolver, Peering):
+        response = resolver.lookup(request, data)
+        if response is not None:
+            return response
+        response = resolve_request(request, data, config, resolver.default)
+        if response is not None:
+            resolver.fill(request, response)
+        return response
+    if isinstance(resolver, ForwardRules):
+        resolver = resolver.route(str(request.q.qname))
+    if isinstance(resolver, (UpstreamPool, StreamPool)):
+        return resolver.query(data)
+    response = resolver.resolve(request.q)
+    if response is None:
+        return None
+    return answer_from(request, response)
+
+def answer_from(request, response):
+    # reply to the client's own query, dropping upstream-only additionals
+    reply = request.reply(aa=0)
+    reply.header.rcode = response.header.rcode
+    reply.add_answer(*response.rr)
+    reply.add_auth(*response.auth)
+    return reply.pack()
+
+def resolve_scoped(request, key, config, cache, resolver, scopes, client):
+    """
+        Resolve with the client's subnet sent upstream. Answers the
+        upstream scoped to a subnet are cached for that subnet only.
+    """
+    data = with_subnet(request, client, config.ecs_prefix_v4, config.ecs_prefix_v6, config.buffer_size)
+    response = resolve_request(request, data, config, resolver)
+    if response is None:
+        return None
+    parsed = DNSUtils.parse(response)
+    if parsed.header.rcode == 0 and parsed.rr:
+        prefix = scope(parsed)
+        if prefix:
+            source = config.ecs_prefix_v4 if ':' not in client else config.ecs_prefix_v6
+            scopes.add(cache, key, client, min(prefix, source), parsed.rr,
+                       min(rr.ttl for rr in parsed.rr))
+        else:
+            store_rrsets(cache, request.q.qname, request.q.qtype, parsed.rr)
+    return answer_from(request, parsed)
+
+def build_pipeline(config, cache, zones, blocklist, resolver=None, scopes=None, special=None):
+    """
+        decode -> zones -> special -> blocklist -> scoped -> cache -> resolve -> store
+        Stages with nothing configured are left out; a hit ends the
+        pipeline at the cache stage.
+    """
+    def decode(query):
+        request = query.request = DNSUtils.parse(query.data)
+        query.name = str(request.q.qname)
+        query.qtype = request.q.qtype
+        query.key = (query.name.lower(), QTYPE.get(query.qtype))
+
+    def local_zones(query):
+        return zones.answer(query.request, query.data)
+
+    def special_use(query):
+        return special.answer(query.data, query.name, query.qtype)
+
+    def blocked(query):
+        action = blocklist.check(query.name)
+        if action is not None:
+            log('blocked', *query.key)
+            return blocklist.respond(query.data, action)
+
+    def scoped(query):
+        if query.client is None:
+            return None
+        entry = scopes.get(cache, query.key, query.client)
+        if entry is not None:
+            log('hit', *query.key)
+            hitters.record(True, query.key)
+            record, remaining = entry
+            reply = query.request.reply(aa=0)
+            reply.add_answer(*(RR(rr.rname, rr.rtype, rr.rclass, remaining, rr.rdata) for rr in record))
+            return reply.pack()
+
+    plans = {}
+
+    def hit_reply(query):
+        # a key's answer only changes when its records are replaced: the
+        # plan is reused while the chain holds the same rdata objects and
+        # only the id, flags, question case and remaining TTLs are patched
+        chain, data = query.chain, query.data
+        id, flags = struct.unpack_from("!HH", data)
+        # QR and RA plus the client's RD and CD only: cached data is not
+        # validated here, so AD and the Z bits must not be echoed
+        flags = 0x8080 | (flags & 0x0110)
+        question = data[12:question_end(data)]
+        entry = plans.get(query.key)
+        if (entry is None or len(entry[0]) != len(chain)
+                or entry[1].question != len(question)
+                or any(a is not rr.rdata for a, rr in zip(entry[0], chain))):
+            reply = query.request.reply(aa=0)
+            reply.header.bitmap = flags
+            reply.add_answer(*chain)
+            if not config.cache_plans:
+                return reply.pack()
+            if len(plans) >= config.cache_plans:
+                plans.clear()
+            entry = plans[query.key] = (tuple(rr.rdata for rr in chain), reply.compile())
+        return entry[1].pack(id=id, flags=flags,
+                             ttl=[rr.ttl for rr in chain], question=question)
+
+    def cached(query):
+        query.chain, query.missing = get_chain(cache, query.key)
+        if query.chain and query.missing is None:
+            log('hit', *query.key)
+            hitters.record(True, query.key)
+            return hit_reply(query)
+
+    def resolve(query):
+        request, key = query.request, query.key
+        q = request.q
+        scoped = scopes is not None and query.client is not None
+        if query.chain and query.missing is not None and not scoped:
+            # the CNAME links are still cached, only ask for the target;
+            # with ECS the target is where answers vary by subnet, so that
+            # case takes the full scoped resolve below
+            target = DNSUtils(q=DNSQuestion(query.missing, q.qtype, q.qclass))
+            response = resolve_request(target, bytes(target.pack()), config, resolver)
+            if response is not None:
+                parsed = DNSUtils.parse(response)
+                if parsed.header.rcode == 0 and parsed.rr:
+                    store_rrsets(cache, query.missing, q.qtype, parsed.rr)
+                    # already counted as a miss by the cache stage
+                    query.chain, query.missing = get_chain(cache, key, count=False)
+                    if query.chain and query.missing is None:
+                        log('miss', *key)
+                        hitters.record(False, key)
+                        return hit_reply(query)
+        log('miss', *key)
+        hitters.record(False, key)
+        if scoped:
+            return resolve_scoped(request, key, config, cache, resolver, scopes, query.client)
+        query.response = resolve_request(request, query.data, config, resolver)
+
+    def store(query):
+        if query.response is not None:
+            parsed = DNSUtils.parse(query.response)
+            if parsed.header.rcode == 0 and parsed.rr:
+                store_rrsets(cache, query.request.q.qname, query.qtype, parsed.rr)
+
+    stages = [('decode', decode)]
+    if config.zones:
+        stages.append(('zones', local_zones))
+    if special is not None:
+        stages.append(('special', special_use))
+    if config.blocklist:
+        stages.append(('blocklist', blocked))
+    if scopes is not None:
+        stages.append(('scoped', scoped))
+    stages += [('cache', cached), ('resolve', resolve), ('store', store)]
+    return Pipeline(stages)
+
+def serve_query(pipeline, query):
+    try:
+        return pipeline.process(query)
+    except DNSError as e:
+        log('error', detail=str(e))
+        return None
+    except Exception as e:
+        # no single datagram may end the serving loop
+        log('error', detail='%s: %s' % (type(e).__name__, e))
+        return None
+
+def serve_request(pipeline, data, client=None):
+    return serve_query(pipeline, Query(data, client))
+
+def open_cache(config):
+    """
+        Load the cache dump. Any thread besides the listener writing the
+        cache needs the locked, sharded one: the workers, the peer server,
+        the warm-up pool (several resolving threads even when the
+        listener waits for it) and the control server's purge / snapshot.
+    """
+    if config.workers or config.peer_address or config.warmup or config.control_socket:
+        return ShardedCache.from_dump(config.cache_dump, config.cache_shards,
+                                      max_records=config.cache_max_records,
+                                      admission=config.cache_admission)
+    return Cache.from_dump(config.cache_dump, max_records=config.cache_max_records,
+                           admission=config.cache_admission)
@@ -0,0 +1,183 @@
+import socket
+import ssl
+import struct
+import threading
+import time
+
+from dnsUtils import DNSUtils, RR, QTYPE, RCODE
+
+
+class StubServer:
+    """
+        UDP DNS server for tests, on a free local port unless `address`
+        is given. handler(request, data) returns the reply (DNSUtils or
+        bytes) or None to stay silent; every parsed query is kept in
+        `queries`.
+    """
+
+    def __init__(self, handler, address=('127.0.0.1', 0)):
+        self.handler = handler
+        self.queries = []
+        family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.address = self.sock.getsockname()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, client = self.sock.recvfrom(4096)
+            except OSError:
+                return
+            request = DNSUtils.parse(data)
+            self.queries.append(request)
+            response = self.handler(request, data)
+            if response is None:
+                continue
+            if isinstance(response, DNSUtils):
+                response = response.pack()
+            try:
+                self.sock.sendto(bytes(response), client)
+            except OSError:
+                # closed while a slow handler was running
+                return
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeSocket:
+    """
+        Collects what the server would send
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((bytes(data), address))
+
+
+class Authority:
+    """
+        Handler for an authoritative StubServer: answers from `records`
+        (zone file text), refers names under a delegation to its NS and
+        glue, and is NXDOMAIN for the rest
+    """
+
+    def __init__(self, records='', delegations=''):
+        self.records = RR.fromZone(records) if records else []
+        self.delegations = RR.fromZone(delegations) if delegations else []
+
+    def __call__(self, request, data):
+        q = request.q
+        reply = request.reply(ra=0, aa=1)
+        owned = [rr for rr in self.records if rr.rname == q.qname]
+        if owned:
+            reply.add_answer(*([rr for rr in owned if rr.rtype == q.qtype]
+                               or [rr for rr in owned if rr.rtype == QTYPE.CNAME]))
+            return reply
+        for rr in self.delegations:
+            if rr.rtype == QTYPE.NS and q.qname.matchSuffix(rr.rname):
+                ns = [n for n in self.delegations if n.rtype == QTYPE.NS and n.rname == rr.rname]
+                names = [n.rdata.label for n in ns]
+                reply.header.aa = 0
+                reply.add_auth(*ns)
+                reply.add_ar(*(g for g in self.delegations if g.rtype == QTYPE.A and g.rname in names))
+                return reply
+        reply.header.rcode = RCODE.NXDOMAIN
+        return reply
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class StreamStub:
+    """
+        TCP DNS server for tests, TLS when given a server `context`. Each
+        query is answered on its own thread after delay(request) seconds,
+        so replies overtake each other; after `drop_after` queries a
+        connection is closed to force a reconnect.
+    """
+
+    def __init__(self, handler, context=None, delay=lambda request: 0, drop_after=None):
+        self.handler = handler
+        self.context = context
+        self.delay = delay
+        self.drop_after = drop_after
+        self.connections = 0
+        self.queries = 0
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.address = self.sock.getsockname()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            if self.context is not None:
+                conn = self.context.wrap_socket(conn, server_side=True)
+        except (OSError, ssl.SSLError):
+            conn.close()
+            return
+        self.connections += 1
+        lock = threading.Lock()
+        reader = conn.makefile('rb')
+        count = 0
+        try:
+            while self.drop_after is None or count < self.drop_after:
+                header = reader.read(2)
+                if len(header) < 2:
+                    return
+                data = reader.read(struct.unpack('!H', header)[0])
+                count += 1
+                self.queries += 1
+                threading.Thread(target=self._answer, args=(conn, lock, data), daemon=True).start()
+            # let the answers already started go out, then hang up
+            time.sleep(0.05)
+        except OSError:
+            pass
+        finally:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def _answer(self, conn, lock, data):
+        request = DNSUtils.parse(data)
+        time.sleep(self.delay(request))
+        response = bytes(self.handler(request, data).pack())
+        try:
+            with lock:
+                conn.sendall(struct.pack('!H', len(response)) + response)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
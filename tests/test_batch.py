@@ -0,0 +1,52 @@
+import select
+import socket
+import struct
+import unittest
+
+from conf import Config
+from dnsUtils import DNSUtils
+from main import receive_batch, limit_batch
+from ratelimit import RateLimiter
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.setblocking(False)
+        self.server.bind(('127.0.0.1', 0))
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(1)
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+        self.config = Config()
+        self.config.batch_size = 3
+
+    def send(self, count):
+        for i in range(count):
+            request = DNSUtils.question(f'n{i}.example.com')
+            request.header.id = 100 + i
+            self.client.sendto(bytes(request.pack()), self.server.getsockname())
+        select.select([self.server], [], [], 1)
+
+    def test_drains_at_most_batch_size(self):
+        self.send(5)
+        self.assertEqual(len(receive_batch(self.server, self.config)), 3)
+        self.assertEqual(len(receive_batch(self.server, self.config)), 2)
+        # nothing queued: returns at once instead of blocking
+        self.assertEqual(receive_batch(self.server, self.config), [])
+
+    def test_rate_limited_queries_get_tc(self):
+        self.send(3)
+        batch = receive_batch(self.server, self.config)
+        limiter = RateLimiter(rate=1, burst=1, slip=1, clock=lambda: 0.0)
+        allowed = limit_batch(self.server, batch, limiter)
+        self.assertEqual([struct.unpack_from('!H', data)[0] for data, _ in allowed], [100])
+        for id in (101, 102):
+            data = self.client.recv(512)
+            self.assertEqual(struct.unpack_from('!HH', data), (id, 0x8380))
+            self.assertEqual(DNSUtils.parse(data).q.qname, f'n{id - 100}.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
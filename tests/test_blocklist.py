@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from dnsUtils import DNSUtils, RCODE
+from policy import Blocklist, NXDOMAIN
+
+RULES = """# sinkholes
+ads.example.com
+0.0.0.0 tracker.example.net
+*.doubleclick.test
+portal.corp 10.0.0.7   # rewrite
+v6.corp ::1
+"""
+
+
+class BlocklistTest(unittest.TestCase):
+
+    def setUp(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'blocklist')
+        with open(filename, 'w') as f:
+            f.write(RULES)
+        self.blocklist = Blocklist()
+        self.blocklist.load(filename)
+
+    def respond(self, name, qtype='A'):
+        data = bytes(DNSUtils.question(name, qtype).pack())
+        return DNSUtils.parse(self.blocklist.respond(data, self.blocklist.check(name)))
+
+    def test_rules(self):
+        self.assertEqual(len(self.blocklist), 5)
+        self.assertEqual(self.blocklist.check('ADS.example.com.'), NXDOMAIN)
+        self.assertEqual(self.blocklist.check('tracker.example.net'), NXDOMAIN)
+        self.assertEqual(self.blocklist.check('a.b.doubleclick.test'), NXDOMAIN)
+        self.assertIsNone(self.blocklist.check('doubleclick.test'))
+        self.assertIsNone(self.blocklist.check('example.com'))
+
+    def test_responses(self):
+        self.assertEqual(self.respond('ads.example.com').header.rcode, RCODE.NXDOMAIN)
+        self.assertEqual(str(self.respond('portal.corp').rr[0].rdata), '10.0.0.7')
+        self.assertEqual(str(self.respond('v6.corp', 'AAAA').rr[0].rdata), '::1')
+        # a rewrite for another address family answers NODATA
+        response = self.respond('portal.corp', 'AAAA')
+        self.assertEqual((response.header.rcode, response.rr), (RCODE.NOERROR, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
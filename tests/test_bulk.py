@@ -0,0 +1,75 @@
+import os
+import struct
+import tempfile
+import unittest
+
+import bulk
+from bulk import decode_batch, qname, read_pcap, COLUMNS
+from dnsUtils import DNSUtils
+
+PACKETS = [bytes(DNSUtils.question('www%d.example.com' % i, 'AAAA' if i % 3 else 'A').pack())
+           for i in range(20)]
+BAD = [b'', b'\x00' * 5, PACKETS[0][:15], PACKETS[1][:12] + b'\xc0\x0c\x00\x01\x00\x01']
+
+
+def udp_ipv4(payload, port=53):
+    udp = struct.pack('!HHHH', 40000, port, 8 + len(payload), 0) + payload
+    return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                       bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2])) + udp
+
+
+def write_pcap(frames, linktype):
+    filename = os.path.join(tempfile.mkdtemp(), 'capture.pcap')
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, linktype))
+        for frame in frames:
+            f.write(struct.pack('<IIII', 0, 0, len(frame), len(frame)) + frame)
+    return filename
+
+
+class DecodeTest(unittest.TestCase):
+
+    def check(self, columns, packets):
+        for row, packet in enumerate(packets):
+            if not columns['valid'][row]:
+                continue
+            parsed = DNSUtils.parse(packet)
+            self.assertEqual(qname(columns, row), str(parsed.q.qname))
+            self.assertEqual(int(columns['qtype'][row]), parsed.q.qtype)
+            self.assertEqual(int(columns['id'][row]), parsed.header.id)
+
+    def test_python_path(self):
+        packets = PACKETS + BAD
+        columns = decode_batch(packets, use_numpy=False)
+        self.assertEqual(list(columns['valid']), [1] * len(PACKETS) + [0] * len(BAD))
+        self.check(columns, packets)
+
+    def test_numpy_path_matches(self):
+        if bulk.np is None:
+            self.skipTest('numpy not installed')
+        packets = BAD + PACKETS + BAD
+        fast, slow = decode_batch(packets, use_numpy=True), decode_batch(packets, use_numpy=False)
+        for name in COLUMNS:
+            self.assertEqual([int(v) for v in fast[name]], [int(v) for v in slow[name]], name)
+        self.assertEqual(fast['data'], slow['data'])
+        self.check(fast, packets)
+        self.assertFalse(decode_batch([b''], use_numpy=True)['valid'][0])
+
+
+class PcapTest(unittest.TestCase):
+
+    def test_ethernet_and_cooked_captures(self):
+        ip = [udp_ipv4(p) for p in PACKETS[:3]] + [udp_ipv4(PACKETS[3], port=5353)]
+        ethernet = [bytes(12) + b'\x08\x00' + frame for frame in ip]
+        sll = [bytes(14) + b'\x08\x00' + frame for frame in ip]
+        sll2 = [b'\x08\x00' + bytes(18) + frame for frame in ip]
+        for frames, linktype in ((ethernet, 1), (sll, 113), (sll2, 276), (ip, 101)):
+            self.assertEqual(list(read_pcap(write_pcap(frames, linktype))), PACKETS[:3], linktype)
+
+    def test_unsupported_link_type(self):
+        with self.assertRaises(ValueError):
+            list(read_pcap(write_pcap([], 105)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from cache import Cache, ShardedCache, store_rrsets, get_chain, CLEAN_INTERVAL
+from dnsUtils import RR, RD, A, CNAME, QTYPE
+
+
+def rr(name, rtype, rdata, ttl=300):
+    return RR(name, getattr(QTYPE, rtype), 1, ttl, rdata)
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = Cache(clock=lambda: 1000.0)
+
+    def test_only_the_question_chain_is_cached(self):
+        answer = [rr('WWW.example.com', 'CNAME', CNAME('web.example.com'), 60),
+                  rr('web.example.com', 'A', A('192.0.2.1')),
+                  rr('bank.example.net', 'A', A('203.0.113.66'))]
+        store_rrsets(self.cache, 'www.example.com.', QTYPE.A, answer)
+        self.assertIsNone(self.cache.get(('bank.example.net.', 'A')))
+        chain, missing = get_chain(self.cache, ('www.example.com.', 'A'))
+        self.assertIsNone(missing)
+        self.assertEqual([str(r.rdata) for r in chain], ['web.example.com.', '192.0.2.1'])
+        # links and targets keep their own TTLs
+        self.assertEqual([r.ttl for r in chain], [60, 300])
+
+    def test_unrelated_answer_is_ignored(self):
+        store_rrsets(self.cache, 'a.example.com.', QTYPE.A,
+                     [rr('b.example.com', 'A', A('192.0.2.2'))])
+        self.assertEqual(self.cache.stats()['records'], 0)
+
+    def test_cname_question(self):
+        store_rrsets(self.cache, 'www.example.com.', QTYPE.CNAME,
+                     [rr('www.example.com', 'CNAME', CNAME('web.example.com')),
+                      rr('web.example.com', 'A', A('192.0.2.1'))])
+        self.assertIsNotNone(self.cache.get(('www.example.com.', 'CNAME')))
+        self.assertIsNone(self.cache.get(('web.example.com.', 'A')))
+
+    def test_unparsed_names_are_not_cached(self):
+        # an AFSDB still holding a compression pointer into its packet
+        store_rrsets(self.cache, 'cell.example.com.', 18,
+                     [RR('cell.example.com', 18, 1, 300, RD(b'\x00\x01\xc0\x0c'))])
+        self.assertEqual(self.cache.stats()['records'], 0)
+
+    def test_sharded_cache(self):
+        cache = ShardedCache(4)
+        store_rrsets(cache, 'x.example.com.', QTYPE.A, [rr('x.example.com', 'A', A('192.0.2.3'))])
+        self.assertEqual(get_chain(cache, ('x.example.com.', 'A'))[1], None)
+
+
+class CleanTest(unittest.TestCase):
+
+    def test_expired_records_are_swept_on_add(self):
+        now = [1000.0]
+        for cache in (Cache(clock=lambda: now[0]), ShardedCache(1, clock=lambda: now[0])):
+            for i in range(10):
+                cache.add((f'{i}.example.com.', 'A'), [], 'A', 10)
+            now[0] += CLEAN_INTERVAL
+            cache.add(('live.example.com.', 'A'), [], 'A', 10)
+            self.assertEqual(cache.stats()['records'], 1)
+
+
+class CountTest(unittest.TestCase):
+
+    def test_one_count_per_lookup(self):
+        for cache in (Cache(clock=lambda: 1000.0), ShardedCache(4, clock=lambda: 1000.0)):
+            store_rrsets(cache, 'www.example.com.', QTYPE.A,
+                         [rr('www.example.com', 'CNAME', CNAME('web.example.com')),
+                          rr('web.example.com', 'A', A('192.0.2.1'))])
+            get_chain(cache, ('nope.example.com.', 'A'))
+            get_chain(cache, ('www.example.com.', 'A'))
+            get_chain(cache, ('www.example.com.', 'A'), count=False)
+            stats = cache.stats()
+            self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
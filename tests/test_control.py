@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from cache import Cache, ShardedCache
+from conf import Config
+from control import Commands, ControlError, ControlServer, send_command
+from dnsUtils import RR, A, AAAA, QTYPE
+
+
+def add(cache, name, rtype='A'):
+    rdata = A('192.0.2.1') if rtype == 'A' else AAAA('2001:db8::1')
+    cache.add((name, rtype), [RR(name, getattr(QTYPE, rtype), 1, 300, rdata)], rtype, 300)
+
+
+class CommandsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config = Config()
+        self.config.cache_dump = os.path.join(self.dir, 'dns.cache')
+        self.cache = ShardedCache(4)
+        for name in ('example.com.', 'www.example.com.', 'notexample.com.'):
+            add(self.cache, name)
+        add(self.cache, 'example.com.', 'AAAA')
+        self.commands = Commands(self.cache, self.config)
+
+    def test_parsing(self):
+        for line in ('', 'nope', '_entries', 'run stats', 'purge', 'stats extra'):
+            with self.assertRaises(ControlError):
+                self.commands.run(line)
+        self.assertEqual(self.commands.run('stats')['records'], 4)
+
+    def test_purge_by_type(self):
+        self.assertEqual(self.commands.run('purge EXAMPLE.com a'), {'purged': 1})
+        self.assertIsNone(self.cache.get(('example.com.', 'A')))
+        self.assertIsNotNone(self.cache.get(('example.com.', 'AAAA')))
+        self.assertEqual(self.commands.run('purge example.com.'), {'purged': 1})
+        self.assertIsNotNone(self.cache.get(('www.example.com.', 'A')))
+
+    def test_purge_suffix(self):
+        self.assertEqual(self.commands.run('purge-suffix example.com'), {'purged': 3})
+        self.assertEqual([entry['name'] for entry in self.commands.run('list')], ['notexample.com.'])
+
+    def test_purge_tombstones_snapshot_records(self):
+        self.commands.run('snapshot')
+        cache = Cache.from_dump(self.config.cache_dump)
+        commands = Commands(cache, self.config)
+        self.assertEqual(len(commands.run('list www.')), 1)
+        self.assertEqual(commands.run('purge www.example.com'), {'purged': 1})
+        # the snapshot still holds the record, the tombstone hides it
+        self.assertIsNone(cache.get(('www.example.com.', 'A')))
+        self.assertEqual(commands.run('list www.'), [])
+        self.assertEqual(commands.run('purge www.example.com'), {'purged': 0})
+        commands.run('snapshot')
+        self.assertIsNone(Cache.from_dump(self.config.cache_dump).get(('www.example.com.', 'A')))
+
+    def test_control_server(self):
+        path = os.path.join(self.dir, 'dns.ctl')
+        server = ControlServer(path, self.commands)
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertEqual(send_command(path, 'purge www.example.com A'),
+                         {'ok': True, 'result': {'purged': 1}})
+        self.assertEqual(send_command(path, 'bogus'), {'ok': False, 'error': 'Unknown command: bogus'})
+
+
+if __name__ == '__main__':
+    unittest.main()
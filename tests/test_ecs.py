@@ -0,0 +1,98 @@
+import unittest
+
+from cache import Cache, store_rrsets
+from conf import Config
+from dnsUtils import DNSUtils, RR, A, CNAME, OPT, EDNSOption, QTYPE
+from ecs import ECS, ScopeIndex, encode, scope, with_subnet
+from policy import Blocklist
+from stages import build_pipeline, serve_request
+from upstream import UpstreamPool
+from zone import ZoneStore
+from stubs import StubServer
+
+
+def client_option(data):
+    request = DNSUtils.parse(data)
+    opt = [rr for rr in request.ar if rr.rtype == QTYPE.OPT]
+    return opt[0], [o for o in opt[0].rdata.options if o.code == ECS]
+
+
+class SubnetOptionTest(unittest.TestCase):
+
+    def test_prefix_truncates_address(self):
+        self.assertEqual(encode('198.51.100.77', 24).data, b'\x00\x01\x18\x00\xc6\x33\x64')
+        self.assertEqual(encode('2001:db8:1:2::1', 56).data[:4], b'\x00\x02\x38\x00')
+        self.assertEqual(len(encode('2001:db8:1:2::1', 56).data), 4 + 7)
+
+    def test_with_subnet_replaces_client_option(self):
+        request = DNSUtils.question('example.com')
+        request.add_ar(RR('.', QTYPE.OPT, 1232, 0, OPT([EDNSOption(ECS, encode('10.0.0.1', 32).data),
+                                                        EDNSOption(10, b'cookie42')])))
+        opt, options = client_option(with_subnet(request, '198.51.100.77'))
+        self.assertEqual(opt.rclass, 1232)
+        self.assertEqual([o.data for o in options], [encode('198.51.100.77', 24).data])
+        self.assertIn(10, [o.code for o in opt.rdata.options])
+
+    def test_scope(self):
+        response = DNSUtils.question('example.com').reply()
+        self.assertIsNone(scope(response))
+        response.add_ar(RR('.', QTYPE.OPT, 1232, 0, OPT([EDNSOption(ECS, b'\x00\x01\x18\x10\xc6\x33')])))
+        self.assertEqual(scope(response), 16)
+
+
+class ScopeIndexTest(unittest.TestCase):
+
+    def test_answers_stay_in_their_subnet(self):
+        cache, scopes = Cache(), ScopeIndex()
+        key = ('cdn.example.', 'A')
+        scopes.add(cache, key, '198.51.100.77', 24, [RR('cdn.example', QTYPE.A, 1, 60, A('10.0.1.1'))], 60)
+        scopes.add(cache, key, '203.0.113.5', 16, [RR('cdn.example', QTYPE.A, 1, 60, A('10.0.2.1'))], 60)
+        self.assertEqual(str(scopes.get(cache, key, '198.51.100.1')[0][0].rdata), '10.0.1.1')
+        self.assertEqual(str(scopes.get(cache, key, '203.0.7.7')[0][0].rdata), '10.0.2.1')
+        self.assertIsNone(scopes.get(cache, key, '192.0.2.1'))
+        self.assertIsNone(scopes.get(cache, key, '2001:db8::1'))
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_load_rebuilds_prefixes(self):
+        scopes = ScopeIndex()
+        scopes.load([('a.example.', 'A', '198.51.100.0/24'), ('a.example.', 'A')])
+        cache = Cache()
+        cache.add(('a.example.', 'A', '198.51.100.0/24'), [RR('a.example', QTYPE.A, 1, 60, A('10.0.0.9'))], 'A', 60)
+        self.assertIsNotNone(scopes.get(cache, ('a.example.', 'A'), '198.51.100.200'))
+
+
+def cdn(request, data):
+    # a CDN answer scoped to the client's /24
+    _, options = client_option(data)
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(request.q.qname, QTYPE.CNAME, 1, 300, CNAME('edge.cdn.example')),
+                     RR('edge.cdn.example', QTYPE.A, 1, 60, A('10.0.1.1')))
+    scoped = options[0].data[:3] + b'\x18' + options[0].data[4:]
+    reply.add_ar(RR('.', QTYPE.OPT, 1232, 0, OPT([EDNSOption(ECS, scoped)])))
+    return reply
+
+
+class ScopedPipelineTest(unittest.TestCase):
+
+    def test_partial_chain_resolves_with_the_subnet(self):
+        with StubServer(cdn) as stub:
+            config = Config()
+            config.special_zones = False
+            cache, scopes = Cache(), ScopeIndex()
+            # the link is cached globally, its CDN target is not
+            store_rrsets(cache, 'www.example.com.', QTYPE.A,
+                         [RR('www.example.com', QTYPE.CNAME, 1, 300, CNAME('edge.cdn.example'))])
+            pipeline = build_pipeline(config, cache, ZoneStore(), Blocklist(),
+                                      UpstreamPool([stub.address], 0.5), scopes)
+            response = serve_request(pipeline, bytes(DNSUtils.question('www.example.com').pack()),
+                                     '198.51.100.77')
+            self.assertEqual(str(DNSUtils.parse(response).rr[-1].rdata), '10.0.1.1')
+            self.assertEqual([str(q.q.qname) for q in stub.queries], ['www.example.com.'])
+            self.assertEqual(len(client_option(bytes(stub.queries[0].pack()))[1]), 1)
+            # the target answer stays in the client's subnet
+            self.assertIsNone(cache.get(('edge.cdn.example.', 'A')))
+            self.assertIsNotNone(scopes.get(cache, ('www.example.com.', 'A'), '198.51.100.1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from conf import Config
+from forwarding import ForwardRules
+
+
+class ForwardRulesTest(unittest.TestCase):
+
+    def test_longest_suffix_wins(self):
+        rules = ForwardRules('default')
+        rules.add('corp.', 'corp')
+        rules.add('lab.corp', 'lab')
+        self.assertEqual(rules.route('host.lab.corp.'), 'lab')
+        self.assertEqual(rules.route('HOST.Corp'), 'corp')
+        self.assertEqual(rules.route('lab.corp'), 'lab')
+        self.assertEqual(rules.route('mylab.corp'), 'corp')
+        self.assertEqual(rules.route('example.com'), 'default')
+        self.assertEqual(rules.route('corp.example.com'), 'default')
+
+    def test_from_config(self):
+        config = Config()
+        config.forward_rules = {
+            'corp': [('127.0.0.1', 5301)],
+            'lab.corp': {'upstreams': [('::1', 5302)], 'timeout': 0.2, 'hedge': False},
+        }
+        rules = ForwardRules.from_config(config, 'default')
+        corp, lab = rules.route('a.corp'), rules.route('a.lab.corp')
+        self.assertEqual(corp.addresses, [('127.0.0.1', 5301)])
+        self.assertEqual(corp.hedge, config.hedge)
+        self.assertEqual(lab.addresses[0][:2], ('::1', 5302))
+        self.assertFalse(lab.hedge)
+        self.assertEqual(rules.route('example.com'), 'default')
+
+
+if __name__ == '__main__':
+    unittest.main()
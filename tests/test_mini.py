@@ -0,0 +1,49 @@
+import socket
+import unittest
+
+from conf import Config
+from dnsUtils import DNSUtils, RR, A
+from DNSServerMini.server import Server
+from stubs import StubServer
+
+
+def answer(request, data):
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(request.q.qname, 1, 1, 60, A('192.0.2.1')))
+    return reply
+
+
+class StubConfig(Config):
+
+    def __init__(self, forwarder):
+        super().__init__()
+        self.forwarder = forwarder
+        self.cache_dump = '/nonexistent/dns.cache'
+
+    @property
+    def forwarder_address(self):
+        return self.forwarder
+
+
+class MiniServerTest(unittest.TestCase):
+
+    def test_runs_the_shared_stages(self):
+        with StubServer(answer) as stub:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.addCleanup(sock.close)
+            server = Server(sock, StubConfig(stub.address))
+            self.assertEqual([name for name, _ in server.pipeline.stages],
+                             ['decode', 'special', 'cache', 'resolve', 'store'])
+            data = bytes(DNSUtils.question('www.example.test').pack())
+            for _ in range(2):
+                response = server.pipeline.run(data, '127.0.0.1')
+                self.assertEqual(str(DNSUtils.parse(response).rr[0].rdata), '192.0.2.1')
+            self.assertEqual(len(stub.queries), 1)
+            self.assertEqual(server.pipeline.stats()['cache']['answered'], 1)
+            # special-use names never leave the server
+            response = server.pipeline.run(bytes(DNSUtils.question('localhost').pack()))
+            self.assertEqual(str(DNSUtils.parse(response).rr[0].rdata), '127.0.0.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import ShardedCache, store_rrsets
+from conf import Config
+from dnsUtils import DNSUtils, RR, A, QTYPE, RCODE
+from main import dispatch_batch
+from stages import build_pipeline
+from overload import PendingQueue
+from policy import Blocklist
+from upstream import UpstreamPool
+from zone import ZoneStore
+from stubs import StubServer, FakeSocket
+
+
+class PendingQueueTest(unittest.TestCase):
+
+    def test_full_queue_sheds(self):
+        release = threading.Event()
+        done = []
+        with ThreadPoolExecutor(2) as executor:
+            queue = PendingQueue(executor, limit=3)
+            accepted = [queue.submit(lambda q: release.wait(5) and q, i, done.append) for i in range(5)]
+            self.assertEqual(accepted, [True, True, True, False, False])
+            self.assertEqual(queue.stats()['pending'], 3)
+            release.set()
+        self.assertEqual(sorted(done), [0, 1, 2])
+        self.assertEqual(queue.stats(), {'pending': 0, 'limit': 3, 'shed': 2, 'expired': 0})
+
+    def test_expired_work_is_dropped(self):
+        now = [0.0]
+        start = threading.Event()
+        done = []
+        with ThreadPoolExecutor(1) as executor:
+            queue = PendingQueue(executor, limit=4, deadline=2.0, clock=lambda: now[0])
+            # the only worker is busy while the clock moves past the deadline
+            queue.submit(lambda q: start.wait(5) and q, 'busy', done.append)
+            queue.submit(lambda q: q, 'late', done.append)
+            now[0] = 3.0
+            start.set()
+        self.assertEqual(done, ['busy', None])
+        self.assertEqual(queue.stats()['expired'], 1)
+
+
+class DispatchTest(unittest.TestCase):
+    """
+        With upstream stalled, hits are still answered at once and misses
+        past max_pending are shed with shed_rcode
+    """
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.upstream = StubServer(self.slow)
+        self.config = Config()
+        self.config.special_zones = False
+        self.config.max_pending = 2
+        self.cache = ShardedCache(4)
+        store_rrsets(self.cache, 'hit.test.', QTYPE.A, [RR('hit.test', QTYPE.A, 1, 300, A('192.0.2.1'))])
+        pipeline = build_pipeline(self.config, self.cache, ZoneStore(), Blocklist(),
+                                  UpstreamPool([self.upstream.address], 2.0, hedge=False, retries=0))
+        self.front, self.back = pipeline.split('cache')
+
+    def slow(self, request, data):
+        self.release.wait(5)
+        reply = request.reply(aa=0)
+        reply.add_answer(RR(request.q.qname, QTYPE.A, 1, 300, A('192.0.2.2')))
+        return reply
+
+    def tearDown(self):
+        self.release.set()
+        self.upstream.close()
+
+    def test_hits_flow_and_misses_are_shed(self):
+        server = FakeSocket()
+        batch = [(bytes(DNSUtils.question('miss%d.test' % i).pack()), ('127.0.0.1', 1000 + i))
+                 for i in range(5)]
+        batch.append((bytes(DNSUtils.question('hit.test').pack()), ('127.0.0.1', 2000)))
+        with ThreadPoolExecutor(2) as executor:
+            pending = PendingQueue(executor, self.config.max_pending, self.config.query_deadline)
+            dispatch_batch(server, batch, self.config, self.front, self.back, pending)
+            answered = {address[1]: DNSUtils.parse(data) for data, address in server.sent}
+            self.assertEqual(str(answered[2000].rr[0].rdata), '192.0.2.1')
+            shed = [port for port, r in answered.items() if r.header.rcode == RCODE.SERVFAIL]
+            self.assertEqual(shed, [1002, 1003, 1004])
+            self.release.set()
+        self.assertEqual(pending.stats()['shed'], 3)
+        late = sorted(address[1] for data, address in server.sent[len(answered):])
+        self.assertEqual(late, [1000, 1001])
+
+
+if __name__ == '__main__':
+    unittest.main()
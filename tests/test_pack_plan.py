@@ -0,0 +1,89 @@
+import struct
+import unittest
+
+from cache import Cache, store_rrsets
+from conf import Config
+from dnsUtils import DNSUtils, DNSError, RR, A, CNAME, OPT, QTYPE
+from stages import build_pipeline, serve_request
+from policy import Blocklist
+from upstream import UpstreamPool
+from zone import ZoneStore
+
+
+def chain(ttl=300):
+    return [RR('www.example.com', QTYPE.CNAME, 1, ttl, CNAME('web.example.com')),
+            RR('web.example.com', QTYPE.A, 1, ttl, A('192.0.2.1')),
+            RR('web.example.com', QTYPE.A, 1, ttl, A('192.0.2.2'))]
+
+
+class PackPlanTest(unittest.TestCase):
+
+    def test_plan_matches_pack(self):
+        request = DNSUtils.question('WWW.example.com')
+        reply = request.reply(aa=0)
+        reply.add_answer(*chain())
+        plan = reply.compile()
+        reply.header.id = 777
+        reply.rr = chain(ttl=42)
+        self.assertEqual(plan.pack(id=777, ttl=42), bytes(reply.pack()))
+        reply.rr[0].ttl = 7
+        self.assertEqual(plan.pack(id=777, ttl=[7, 42, 42]), bytes(reply.pack()))
+
+    def test_opt_ttl_is_not_patched(self):
+        reply = DNSUtils.question('example.com').reply()
+        reply.add_answer(RR('example.com', QTYPE.A, 1, 300, A('192.0.2.1')))
+        reply.add_ar(RR('.', QTYPE.OPT, 1232, 0x8000, OPT([])))
+        plan = reply.compile()
+        self.assertEqual(len(plan.ttls), 1)
+        response = DNSUtils.parse(plan.pack(ttl=5))
+        self.assertEqual((response.rr[0].ttl, response.ar[0].ttl), (5, 0x8000))
+
+    def test_question_must_fit(self):
+        plan = DNSUtils.question('example.com').reply().compile()
+        question = bytes(DNSUtils.question('EXAMPLE.com').pack())[12:]
+        self.assertEqual(DNSUtils.parse(plan.pack(question=question)).q.qname.label[0], b'EXAMPLE')
+        with self.assertRaises(DNSError):
+            plan.pack(question=bytes(DNSUtils.question('example.org.uk').pack())[12:])
+
+
+class HitPlanTest(unittest.TestCase):
+    """
+        Cache hits reuse the plan of their key until the records change
+    """
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.cache = Cache(clock=lambda: self.now[0])
+        config = Config()
+        config.special_zones = False
+        self.pipeline = build_pipeline(config, self.cache, ZoneStore(), Blocklist(),
+                                       UpstreamPool([('127.0.0.1', 9)], 0.05))
+
+    def ask(self, name, id):
+        request = DNSUtils.question(name)
+        request.header.id = id
+        request.header.rd = 1
+        return DNSUtils.parse(serve_request(self.pipeline, bytes(request.pack())))
+
+    def test_hits_patch_id_case_and_ttl(self):
+        store_rrsets(self.cache, 'www.example.com.', QTYPE.A, chain())
+        first = self.ask('www.example.com', 1)
+        self.now[0] += 100
+        second = self.ask('WWW.Example.COM', 2)
+        self.assertEqual((second.header.id, second.header.rd, second.header.qr), (2, 1, 1))
+        self.assertEqual(str(second.q.qname), 'WWW.Example.COM.')
+        self.assertEqual([rr.ttl for rr in first.rr], [300, 300, 300])
+        self.assertEqual([rr.ttl for rr in second.rr], [200, 200, 200])
+
+    def test_replaced_records_recompile(self):
+        store_rrsets(self.cache, 'www.example.com.', QTYPE.A, chain())
+        self.ask('www.example.com', 1)
+        store_rrsets(self.cache, 'www.example.com.', QTYPE.A,
+                     [RR('www.example.com', QTYPE.A, 1, 60, A('198.51.100.9'))])
+        response = self.ask('www.example.com', 3)
+        self.assertEqual([str(rr.rdata) for rr in response.rr], ['198.51.100.9'])
+        self.assertEqual(struct.unpack('!H', bytes(response.pack())[:2])[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+
+from cache import ShardedCache, get_chain
+from conf import Config
+from dnsUtils import DNSUtils, RR, A, QTYPE, RCODE
+from stages import build_pipeline, serve_request
+from peering import PeerServer, Peering, sign
+from policy import Blocklist
+from upstream import UpstreamPool
+from zone import ZoneStore
+from stubs import StubServer, free_port
+
+SECRET = 'sibling key'
+
+
+def fill(name, extra=()):
+    request = DNSUtils.question(name)
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(name, QTYPE.A, 1, 300, A('192.0.2.1')), *extra)
+    return bytes(reply.pack())
+
+
+class PeerServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.address = ('127.0.0.1', free_port())
+        self.peer = ('127.0.0.2', 5400)
+        self.cache = ShardedCache(4)
+        self.server = PeerServer(self.address, self.cache, [self.peer])
+        names = ['n%d.test.' % i for i in range(100)]
+        self.own = [n for n in names if self.server.ring.owner(n) == self.address]
+        self.other = [n for n in names if self.server.ring.owner(n) == self.peer]
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def cached(self, name):
+        return get_chain(self.cache, (name, 'A'))[1] is None
+
+    def test_fill_from_sibling_for_owned_name(self):
+        self.server.answer(fill(self.own[0]), self.peer[0])
+        self.assertTrue(self.cached(self.own[0]))
+        response = DNSUtils.parse(self.server.answer(bytes(DNSUtils.question(self.own[0]).pack())))
+        self.assertEqual(str(response.rr[0].rdata), '192.0.2.1')
+
+    def test_fill_rejections(self):
+        # not a sibling, not this node's name, records off the question chain
+        self.server.answer(fill(self.own[0]), '192.0.2.99')
+        self.server.answer(fill(self.other[0]), self.peer[0])
+        self.server.answer(fill(self.own[1], [RR(self.own[2], QTYPE.A, 1, 300, A('203.0.113.6'))]),
+                           self.peer[0])
+        self.assertFalse(self.cached(self.own[0]))
+        self.assertFalse(self.cached(self.other[0]))
+        self.assertTrue(self.cached(self.own[1]))
+        self.assertFalse(self.cached(self.own[2]))
+        self.assertEqual(self.server.rejected, 2)
+
+    def test_signed_fills(self):
+        self.server.secret = SECRET
+        self.server.answer(fill(self.own[0]), self.peer[0])
+        self.server.answer(sign('wrong key', fill(self.own[1])), self.peer[0])
+        self.server.answer(sign(SECRET, fill(self.own[2])), self.peer[0])
+        self.assertEqual([self.cached(n) for n in self.own[:3]], [False, False, True])
+
+    def test_uncached_is_refused(self):
+        response = DNSUtils.parse(self.server.answer(bytes(DNSUtils.question(self.own[0]).pack())))
+        self.assertEqual(response.header.rcode, RCODE.REFUSED)
+
+    def test_fill_over_the_wire(self):
+        self.server.hosts.add('127.0.0.1')
+        self.server.secret = SECRET
+        self.server.start()
+        try:
+            sibling = Peering(('127.0.0.1', 1), [self.address], secret=SECRET)
+            name = [n for n in self.own if sibling.ring.owner(n) == self.address][0]
+            sibling.fill(DNSUtils.question(name), fill(name))
+            response = DNSUtils.parse(sibling.lookup(DNSUtils.question(name),
+                                                     bytes(DNSUtils.question(name).pack())))
+            self.assertEqual(str(response.rr[0].rdata), '192.0.2.1')
+        finally:
+            self.server.shutdown()
+
+
+class ClusterTest(unittest.TestCase):
+    """
+        Three nodes sharing one upstream: every name goes upstream once,
+        whichever node is asked
+    """
+
+    def setUp(self):
+        self.upstream = StubServer(self.answer)
+        config = Config()
+        config.special_zones = False
+        addresses = [('127.0.0.1', free_port()) for _ in range(3)]
+        self.servers = []
+        self.pipelines = []
+        for address in addresses:
+            peers = [a for a in addresses if a != address]
+            cache = ShardedCache(4)
+            server = PeerServer(address, cache, peers, SECRET)
+            server.start()
+            self.servers.append(server)
+            resolver = Peering(address, peers, UpstreamPool([self.upstream.address], 0.5),
+                               timeout=0.5, secret=SECRET)
+            self.pipelines.append(build_pipeline(config, cache, ZoneStore(), Blocklist(), resolver))
+
+    @staticmethod
+    def answer(request, data):
+        reply = request.reply(aa=0)
+        reply.add_answer(RR(request.q.qname, QTYPE.A, 1, 300, A('192.0.2.1')))
+        return reply
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.upstream.close()
+
+    def test_each_name_goes_upstream_once(self):
+        names = ['h%d.test' % i for i in range(30)]
+        for round in range(3):
+            for i, name in enumerate(names):
+                pipeline = self.pipelines[(i + round) % 3]
+                response = serve_request(pipeline, bytes(DNSUtils.question(name).pack()), '127.0.0.1')
+                self.assertEqual(str(DNSUtils.parse(response).rr[0].rdata), '192.0.2.1')
+        self.assertEqual(sorted(str(q.q.qname) for q in self.upstream.queries),
+                         sorted(name + '.' for name in names))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+
+from querylog import QueryLog
+
+
+def read(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f]
+
+
+class QueryLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), 'queries.log')
+
+    def test_closed_log_records_nothing(self):
+        querylog = QueryLog()
+        querylog.log('hit', 'example.com.', 'A')
+        self.assertEqual(querylog._head, 0)
+
+    def test_jsonl_format(self):
+        querylog = QueryLog()
+        querylog.open(self.filename, interval=60)
+        querylog.log('hit', 'example.com.', 'A')
+        querylog.log('error', detail='bad packet')
+        querylog.close()
+        hit, error = read(self.filename)
+        self.assertEqual(set(hit), {'t', 'e', 'n', 'q'})
+        self.assertEqual((hit['e'], hit['n'], hit['q']), ('hit', 'example.com.', 'A'))
+        self.assertEqual((error['e'], error['d']), ('error', 'bad packet'))
+
+    def test_full_ring_drops_and_counts(self):
+        querylog = QueryLog(capacity=4)
+        # the writer does not wake up before close()
+        querylog.open(self.filename, interval=60)
+        for i in range(6):
+            querylog.log('miss', f'n{i}.', 'A')
+        self.assertEqual(querylog.dropped, 2)
+        querylog.close()
+        self.assertEqual([event['n'] for event in read(self.filename)], ['n0.', 'n1.', 'n2.', 'n3.'])
+
+    def test_sample(self):
+        querylog = QueryLog(sample=3)
+        querylog.open(self.filename, interval=60)
+        for i in range(1, 10):
+            querylog.log('hit', f'n{i}.', 'A')
+        querylog.close()
+        self.assertEqual([event['n'] for event in read(self.filename)], ['n3.', 'n6.', 'n9.'])
+
+    def test_rotation_keeps_numbered_backups(self):
+        querylog = QueryLog()
+        querylog.open(self.filename, max_bytes=100, backups=2, interval=60)
+        for i in range(4):
+            # about 150 bytes per batch, each one rotates the file
+            querylog._write([(0.0, 'hit', f'n{i}.', 'A', None)] * 3)
+        querylog.close()
+        self.assertEqual(read(self.filename), [])
+        self.assertEqual(read(self.filename + '.1')[0]['n'], 'n3.')
+        self.assertEqual(read(self.filename + '.2')[0]['n'], 'n2.')
+        self.assertFalse(os.path.exists(self.filename + '.3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from ratelimit import RateLimiter, ALLOW, DROP, TRUNCATE
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.limiter = RateLimiter(rate=10, burst=5, slip=2, clock=lambda: self.now)
+
+    def test_burst_then_slip(self):
+        actions = [self.limiter.check(('192.0.2.1', 53)) for _ in range(9)]
+        self.assertEqual(actions, [ALLOW] * 5 + [DROP, TRUNCATE, DROP, TRUNCATE])
+
+    def test_refill(self):
+        for _ in range(5):
+            self.limiter.check(('192.0.2.1', 53))
+        self.assertNotEqual(self.limiter.check(('192.0.2.1', 53)), ALLOW)
+        self.now += 0.2
+        self.assertEqual([self.limiter.check(('192.0.2.1', 53)) for _ in range(2)], [ALLOW, ALLOW])
+        self.assertNotEqual(self.limiter.check(('192.0.2.1', 53)), ALLOW)
+
+    def test_prefixes_share_a_bucket(self):
+        for i in range(5):
+            self.limiter.check((f'192.0.2.{i}', 53))
+        self.assertNotEqual(self.limiter.check(('192.0.2.200', 53)), ALLOW)
+        self.assertEqual(self.limiter.check(('192.0.3.1', 53)), ALLOW)
+        for i in range(5):
+            self.limiter.check((f'2001:db8:0:1::{i}', 53, 0, 0))
+        self.assertNotEqual(self.limiter.check(('2001:db8:0:ff::1', 53, 0, 0)), ALLOW)
+        self.assertEqual(self.limiter.check(('2001:db8:0:100::1', 53, 0, 0)), ALLOW)
+
+    def test_bounded(self):
+        limiter = RateLimiter(burst=1, max_clients=2, clock=lambda: self.now)
+        limiter.check(('192.0.2.1', 53))
+        limiter.check(('198.51.100.1', 53))
+        limiter.check(('203.0.113.1', 53))
+        self.assertEqual(len(limiter._buckets), 2)
+        # the evicted prefix starts again with a full bucket
+        self.assertEqual(limiter.check(('192.0.2.1', 53)), ALLOW)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+
+from dnsUtils import DNSUtils, RR, A
+from stubs import StubServer
+
+
+def answer(request, data):
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(request.q.qname, 1, 1, 60, A('192.0.2.1')))
+    return reply
+
+
+class ResolveManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubServer(answer)
+        self.kwargs = dict(dest=self.stub.address[0], port=self.stub.address[1],
+                           concurrency=16, timeout=1)
+
+    def tearDown(self):
+        self.stub.close()
+
+    def test_all_names(self):
+        names = ['h%d.test' % i for i in range(200)]
+        results = dict(DNSUtils.resolve_many_sync(names, **self.kwargs))
+        self.assertEqual(set(results), set(names))
+        self.assertTrue(all(str(r.rr[0].rdata) == '192.0.2.1' for r in results.values()))
+
+    def test_early_stop_ends_the_loop_thread(self):
+        before = set(threading.enumerate())
+        results = DNSUtils.resolve_many_sync(['h%d.test' % i for i in range(5000)], **self.kwargs)
+        next(results)
+        results.close()
+        deadline = time.monotonic() + 5
+        while set(threading.enumerate()) - before and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(set(threading.enumerate()) - before, set())
+        self.assertLess(len(self.stub.queries), 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from dnslib.label import DNSLabel
+from dnsUtils import DNSQuestion, QTYPE, RCODE
+from resolver import IterativeResolver, InfraCache
+from stubs import StubServer, Authority, free_port
+
+ROOT = """
+a.test.         300 IN NS ns.a.test.
+ns.a.test.      300 IN A  127.0.0.2
+b.test.         300 IN NS ns.b.test.
+ns.b.test.      300 IN A  127.0.0.3
+"""
+A_RECORDS = """
+www.a.test.     300 IN CNAME x.b.test.
+loop.a.test.    300 IN CNAME loop.b.test.
+"""
+# the a.test server also hands out glue for a name it is not authoritative for
+A_DELEGATIONS = """
+sub.a.test.     300 IN NS ns.sub.a.test.
+sub.a.test.     300 IN NS ns.evil.test.
+ns.sub.a.test.  300 IN A  127.0.0.4
+ns.evil.test.   300 IN A  127.0.0.9
+"""
+B_RECORDS = """
+x.b.test.       300 IN A  192.0.2.7
+loop.b.test.    300 IN CNAME loop.a.test.
+"""
+SUB_RECORDS = """
+foo.sub.a.test. 300 IN A  192.0.2.8
+"""
+
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        port = free_port()
+        self.servers = [
+            StubServer(Authority(delegations=ROOT), ('127.0.0.1', port)),
+            StubServer(Authority(A_RECORDS, A_DELEGATIONS), ('127.0.0.2', port)),
+            StubServer(Authority(B_RECORDS), ('127.0.0.3', port)),
+            StubServer(Authority(SUB_RECORDS), ('127.0.0.4', port)),
+        ]
+        self.infra = InfraCache([('a.root.test.', '127.0.0.1')])
+        self.resolver = IterativeResolver(self.infra, port=port, timeout=0.5)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def resolve(self, name, qtype='A'):
+        return self.resolver.resolve(DNSQuestion(name, getattr(QTYPE, qtype)))
+
+    def test_cname_into_another_zone(self):
+        response = self.resolve('www.a.test')
+        self.assertEqual([(str(rr.rname), QTYPE.get(rr.rtype)) for rr in response.rr],
+                         [('www.a.test.', 'CNAME'), ('x.b.test.', 'A')])
+        self.assertEqual(str(response.rr[1].rdata), '192.0.2.7')
+
+    def test_cname_loop_is_bounded(self):
+        self.assertIsNone(self.resolve('loop.a.test'))
+
+    def test_nxdomain(self):
+        response = self.resolve('nope.b.test')
+        self.assertEqual((response.header.rcode, response.rr), (RCODE.NXDOMAIN, []))
+
+    def test_out_of_bailiwick_glue_is_ignored(self):
+        response = self.resolve('foo.sub.a.test')
+        self.assertEqual(str(response.rr[0].rdata), '192.0.2.8')
+        names, addresses = self.infra.nameservers(DNSLabel('sub.a.test'))
+        self.assertEqual(addresses, ['127.0.0.4'])
+        self.assertEqual(self.servers[0].queries[0].q.qname, DNSLabel('foo.sub.a.test'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import Cache, ShardedCache
+from conf import Config
+from dnsUtils import DNSUtils, RR, A, CNAME, MX, QTYPE
+from main import dispatch_batch
+from stages import build_pipeline, serve_request
+from overload import PendingQueue
+from policy import Blocklist
+from zone import ZoneStore
+from upstream import UpstreamPool
+from stubs import StubServer, FakeSocket
+
+MALFORMED = [b'\x00\x01\x02\x03\x04',
+             b'\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x03ww',
+             b'\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\xc0\x0c\x00\x01\x00\x01']
+
+
+def answer(request, data):
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(request.q.qname, 1, 1, 60, A('192.0.2.1')))
+    return reply
+
+
+def mail(request, data):
+    reply = request.reply(aa=0)
+    if str(request.q.qname) == 'a.example.com.':
+        reply.add_answer(RR('a.example.com', QTYPE.CNAME, 1, 60, CNAME('b.example.org')))
+    reply.add_answer(RR('b.example.org', QTYPE.MX, 1, 60, MX('mail.b.example.org', 5)))
+    return reply
+
+
+class ServingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubServer(answer)
+        self.config = Config()
+        self.config.special_zones = False
+
+    def tearDown(self):
+        self.stub.close()
+
+    def pipeline(self, cache):
+        resolver = UpstreamPool([self.stub.address], 0.5)
+        return build_pipeline(self.config, cache, ZoneStore(), Blocklist(), resolver)
+
+    def test_malformed_datagrams_are_dropped(self):
+        pipeline = self.pipeline(Cache())
+        for data in MALFORMED:
+            self.assertIsNone(serve_request(pipeline, data, '127.0.0.1'))
+        response = serve_request(pipeline, bytes(DNSUtils.question('ok.test').pack()), '127.0.0.1')
+        self.assertEqual(str(DNSUtils.parse(response).rr[0].rdata), '192.0.2.1')
+
+    def test_malformed_datagrams_with_workers(self):
+        front, back = self.pipeline(ShardedCache(4)).split('cache')
+        server = FakeSocket()
+        with ThreadPoolExecutor(2) as executor:
+            pending = PendingQueue(executor)
+            batch = [(data, ('127.0.0.1', 1000 + i)) for i, data in enumerate(MALFORMED)]
+            batch.append((bytes(DNSUtils.question('ok.test').pack()), ('127.0.0.1', 2000)))
+            dispatch_batch(server, batch, self.config, front, back, pending)
+        self.assertEqual([address for _, address in server.sent], [('127.0.0.1', 2000)])
+
+    def test_cache_hit_flags(self):
+        for plans in (4096, 0):
+            self.config.cache_plans = plans
+            pipeline = self.pipeline(Cache())
+            request = DNSUtils.question('flags.test')
+            # RD, AD, CD and the Z bit as sent by dig +adflag +cdflag
+            request.header.bitmap = 0x0170
+            for _ in range(2):
+                response = serve_request(pipeline, bytes(request.pack()), '127.0.0.1')
+            self.assertEqual(DNSUtils.parse(response).header.bitmap, 0x8190)
+        # the second query of each round was a cache hit
+        self.assertEqual(len(self.stub.queries), 2)
+
+    def test_mx_behind_cname_from_cache(self):
+        self.stub.handler = mail
+        pipeline = self.pipeline(Cache())
+        for name in ('a.example.com', 'b.example.org', 'a.example.com'):
+            response = serve_request(pipeline, bytes(DNSUtils.question(name, 'MX').pack()), '127.0.0.1')
+            mx = DNSUtils.parse(response).rr[-1].rdata
+            self.assertEqual((str(mx.label), mx.preference), ('mail.b.example.org.', 5))
+        self.assertEqual(len(self.stub.queries), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+from cache import Cache
+from dnsUtils import RR, A, QTYPE
+from sketch import CountMinSketch, TinyLFU, TopK, HeavyHitters
+
+
+def record(name):
+    return [RR(name, QTYPE.A, 1, 300, A('192.0.2.1'))]
+
+
+class TinyLFUTest(unittest.TestCase):
+
+    def test_frequent_key_beats_one_hit(self):
+        lfu = TinyLFU(100)
+        for _ in range(5):
+            lfu.record('popular')
+        lfu.record('scan')
+        self.assertTrue(lfu.admit('popular', 'scan'))
+        self.assertFalse(lfu.admit('scan', 'popular'))
+
+    def test_counts_age(self):
+        lfu = TinyLFU(10, sample=20)
+        for _ in range(12):
+            lfu.record('old')
+        for i in range(20):
+            lfu.record('new%d' % (i % 2))
+        self.assertLess(lfu.sketch.estimate('old'), 12)
+
+    def test_reset_halves_every_counter(self):
+        sketch = CountMinSketch(64)
+        for _ in range(15):
+            sketch.increment('a')
+        for _ in range(5):
+            sketch.increment('b')
+        sketch.reset()
+        self.assertEqual((sketch.estimate('a'), sketch.estimate('b')), (7, 2))
+        self.assertLessEqual(max(max(row) for row in sketch._rows), 7)
+
+    def test_scan_does_not_flush_the_cache(self):
+        cache = Cache(max_records=100, clock=lambda: 1000.0)
+        hot = [('hot%d.' % i, 'A') for i in range(100)]
+        for _ in range(4):
+            for key in hot:
+                if cache.get(key) is None:
+                    cache.add(key, record(key[0]), 'A', 300)
+        # a one-off scan five times the cache size
+        for i in range(500):
+            key = ('scan%d.' % i, 'A')
+            if cache.get(key) is None:
+                cache.add(key, record(key[0]), 'A', 300)
+        self.assertGreaterEqual(sum(cache.get(key) is not None for key in hot), 70)
+        self.assertGreater(cache.stats()['rejected'], 350)
+
+    def test_without_admission_the_scan_wins(self):
+        cache = Cache(max_records=100, admission=False, clock=lambda: 1000.0)
+        for i in range(100):
+            cache.add(('hot%d.' % i, 'A'), record('hot%d' % i), 'A', 300)
+        for i in range(500):
+            cache.add(('scan%d.' % i, 'A'), record('scan%d' % i), 'A', 300)
+        self.assertEqual(sum(cache.get(('hot%d.' % i, 'A')) is not None for i in range(100)), 0)
+
+
+class TopKTest(unittest.TestCase):
+
+    def test_heavy_keys_are_found(self):
+        top = TopK(16)
+        # 8 keys seen 300 times each among 2000 one-offs: above N / k
+        for i in range(2400):
+            top.add('heavy%d' % (i % 8))
+            if i < 2000:
+                top.add('rare%d' % i)
+        found = top.top(8)
+        self.assertEqual({key for key, _, _ in found}, {'heavy%d' % i for i in range(8)})
+        for key, count, error in found:
+            # Space-Saving: the true count lies in [count - error, count]
+            self.assertLessEqual(count - error, 300)
+            self.assertGreaterEqual(count, 300)
+
+    def test_memory_is_bounded(self):
+        top = TopK(4)
+        for i in range(1000):
+            top.add(i)
+        self.assertEqual(len(top.top()), 4)
+
+    def test_hits_and_misses_are_kept_apart(self):
+        hitters = HeavyHitters(8)
+        for _ in range(3):
+            hitters.record(True, ('a.test.', 'A'))
+        hitters.record(False, ('b.test.', 'A'))
+        self.assertEqual(hitters.top(True), [(('a.test.', 'A'), 3)])
+        self.assertEqual(hitters.top(False), [(('b.test.', 'A'), 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from cache import Cache, ShardedCache
+from dnsUtils import RR, A, QTYPE
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), 'cache.snap')
+        self.now = 1000.0
+
+    def clock(self):
+        return self.now
+
+    def fill(self, cache):
+        cache.add(('www.example.com.', 'A'), [RR('www.example.com.', QTYPE.A, 1, 300, A('192.0.2.1'))], 'A', 300)
+        cache.add(('old.example.com.', 'A'), [RR('old.example.com.', QTYPE.A, 1, 10, A('192.0.2.2'))], 'A', 10)
+
+    def round_trip(self, cls):
+        cache = cls(clock=self.clock)
+        self.fill(cache)
+        cache.dump_to_file(self.filename)
+        self.now += 100
+        restored = cls.from_dump(self.filename, clock=self.clock)
+        record, ttl = restored.get_with_ttl(('www.example.com.', 'A'))
+        self.assertEqual(str(record[0].rdata), '192.0.2.1')
+        self.assertEqual(ttl, 200)
+        # expired while the server was down
+        self.assertIsNone(restored.get(('old.example.com.', 'A')))
+        self.assertIsNone(restored.get(('missing.example.com.', 'A')))
+
+    def test_cache(self):
+        self.round_trip(Cache)
+
+    def test_sharded_cache(self):
+        self.round_trip(ShardedCache)
+
+    def test_missing_file(self):
+        cache = Cache.from_dump(os.path.join(os.path.dirname(self.filename), 'nothing'))
+        self.assertIsNone(cache.get(('www.example.com.', 'A')))
+
+
+if __name__ == '__main__':
+    unittest.main()
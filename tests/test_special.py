@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from cache import Cache
+from conf import Config
+from dnsUtils import DNSUtils, RR, PTR, QTYPE, RCODE
+from forwarding import ForwardRules
+from stages import build_pipeline, serve_request
+from policy import Blocklist
+from special import SpecialZones
+from upstream import UpstreamPool
+from zone import ZoneStore
+from stubs import StubServer
+
+
+def ask(special, name, qtype='A'):
+    data = bytes(DNSUtils.question(name, qtype).pack())
+    response = special.answer(data, name, getattr(QTYPE, qtype))
+    return DNSUtils.parse(response) if response is not None else None
+
+
+class SpecialZonesTest(unittest.TestCase):
+
+    def test_localhost_and_loopback(self):
+        special = SpecialZones()
+        self.assertEqual([str(rr.rdata) for rr in ask(special, 'app.localhost.').rr], ['127.0.0.1'])
+        self.assertEqual([str(rr.rdata) for rr in ask(special, 'localhost.', 'AAAA').rr], ['::1'])
+        response = ask(special, '1.0.0.127.in-addr.arpa.', 'PTR')
+        self.assertEqual(str(response.rr[0].rdata), 'localhost.')
+
+    def test_private_reverse_and_special_names(self):
+        special = SpecialZones()
+        self.assertEqual(ask(special, '4.3.2.10.in-addr.arpa.', 'PTR').header.rcode, RCODE.NXDOMAIN)
+        self.assertEqual(ask(special, 'printer.home.arpa.').header.rcode, RCODE.NXDOMAIN)
+        self.assertIsNone(ask(special, 'example.com.'))
+        self.assertIsNone(ask(special, '4.3.2.11.in-addr.arpa.', 'PTR'))
+
+    def test_forward_rules_win(self):
+        special = SpecialZones(['10.in-addr.arpa', 'home.arpa.'])
+        self.assertIsNone(ask(special, '4.3.2.10.in-addr.arpa.', 'PTR'))
+        self.assertIsNone(ask(special, 'printer.home.arpa.'))
+        self.assertEqual(ask(special, '1.168.192.in-addr.arpa.', 'PTR').header.rcode, RCODE.NXDOMAIN)
+
+    def test_hosts_file(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'hosts')
+        with open(filename, 'w') as f:
+            f.write('10.0.0.5 nas.home.arpa nas  # storage\n')
+        special = SpecialZones(['home.arpa'])
+        special.load_hosts(filename)
+        self.assertEqual(str(ask(special, 'nas.home.arpa.').rr[0].rdata), '10.0.0.5')
+        self.assertEqual(str(ask(special, '5.0.0.10.in-addr.arpa.', 'PTR').rr[0].rdata), 'nas.home.arpa.')
+
+
+class ForwardedSpecialZoneTest(unittest.TestCase):
+
+    def test_pipeline_forwards_overridden_zone(self):
+        def corp(request, data):
+            reply = request.reply(aa=1)
+            reply.add_answer(RR(request.q.qname, QTYPE.PTR, 1, 300, PTR('fileserver.corp.')))
+            return reply
+
+        with StubServer(corp) as stub:
+            config = Config()
+            config.forward_rules = {'10.in-addr.arpa': [stub.address]}
+            resolver = ForwardRules.from_config(config, UpstreamPool([('127.0.0.1', 9)], 0.05))
+            pipeline = build_pipeline(config, Cache(), ZoneStore(), Blocklist(), resolver,
+                                      special=SpecialZones(config.forward_rules))
+            data = bytes(DNSUtils.question('4.3.2.10.in-addr.arpa', 'PTR').pack())
+            response = DNSUtils.parse(serve_request(pipeline, data))
+        self.assertEqual(str(response.rr[0].rdata), 'fileserver.corp.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from dnsUtils import DNSUtils, RR, A
+from upstream import StreamPool
+from stubs import StreamStub
+
+
+def answer(request, data):
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(request.q.qname, 1, 1, 60, A('192.0.2.1')))
+    return reply
+
+
+def ask(pool, i):
+    """
+        True if query i got the reply to its own id and name
+    """
+    request = DNSUtils.question('n%d.test' % i)
+    request.header.id = i % 65536
+    response = pool.query(bytes(request.pack()))
+    if response is None:
+        return False
+    response = DNSUtils.parse(response)
+    return response.header.id == request.header.id and str(response.q.qname) == 'n%d.test.' % i
+
+
+def self_signed(directory):
+    """
+        Write a localhost certificate and key, None without openssl
+    """
+    if shutil.which('openssl') is None:
+        return None
+    cert, key = os.path.join(directory, 'dot.crt'), os.path.join(directory, 'dot.key')
+    result = subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                             '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+                             '-keyout', key, '-out', cert], capture_output=True)
+    return (cert, key) if result.returncode == 0 else None
+
+
+class StreamPoolTest(unittest.TestCase):
+
+    def test_pipelined_out_of_order(self):
+        with StreamStub(answer, delay=lambda request: random.random() * 0.01) as stub:
+            pool = StreamPool(stub.address, 2)
+            with ThreadPoolExecutor(32) as executor:
+                self.assertTrue(all(executor.map(lambda i: ask(pool, i), range(500))))
+            pool.close()
+        self.assertEqual(pool.connects, 2)
+
+    def test_late_reply_does_not_block_others(self):
+        slow = threading.Event()
+        with StreamStub(answer, delay=lambda request: 0.3 if str(request.q.qname) == 'n0.test.' else 0) as stub:
+            pool = StreamPool(stub.address, 1)
+            finished = []
+
+            def run(i):
+                if i == 0:
+                    slow.set()
+                else:
+                    slow.wait()
+                self.assertTrue(ask(pool, i))
+                finished.append(i)
+
+            with ThreadPoolExecutor(2) as executor:
+                list(executor.map(run, [0, 1]))
+            pool.close()
+        self.assertEqual(finished, [1, 0])
+
+    def test_reconnect_after_upstream_closes(self):
+        with StreamStub(answer, drop_after=50) as stub:
+            pool = StreamPool(stub.address, 2)
+            self.assertTrue(all(ask(pool, i) for i in range(300)))
+            pool.close()
+        self.assertGreater(pool.connects, 2)
+
+    def test_refused_connection(self):
+        stub = StreamStub(answer)
+        address = stub.address
+        stub.close()
+        self.assertFalse(ask(StreamPool(address, 1, timeout=0.5), 1))
+
+
+class TlsPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        files = self_signed(self.directory)
+        if files is None:
+            self.skipTest('openssl cannot make a test certificate')
+        self.cert, key = files
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(self.cert, key)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_tls_with_reconnects(self):
+        with StreamStub(answer, self.context, lambda request: random.random() * 0.005, drop_after=100) as stub:
+            pool = StreamPool(stub.address, 2, tls=True, server_name='localhost', cafile=self.cert)
+            with ThreadPoolExecutor(16) as executor:
+                self.assertTrue(all(executor.map(lambda i: ask(pool, i), range(600))))
+            pool.close()
+        self.assertGreater(pool.connects, 2)
+
+    def test_untrusted_certificate(self):
+        with StreamStub(answer, self.context) as stub:
+            pool = StreamPool(stub.address, 1, tls=True, server_name='localhost', timeout=0.5)
+            self.assertFalse(ask(pool, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import socket
+import time
+import unittest
+
+from dnsUtils import DNSUtils, RR, A
+from upstream import UpstreamPool
+from stubs import StubServer
+
+
+def answer(request, data):
+    reply = request.reply(aa=0)
+    reply.add_answer(RR(request.q.qname, 1, 1, 60, A('192.0.2.1')))
+    return reply
+
+
+class DropFirst:
+    """
+        Ignores the first query, answers the retransmit
+    """
+
+    def __init__(self):
+        self.seen = 0
+
+    def __call__(self, request, data):
+        self.seen += 1
+        return answer(request, data) if self.seen > 1 else None
+
+
+def slow(request, data):
+    time.sleep(0.3)
+    return answer(request, data)
+
+
+def query(pool, name='example.test'):
+    response = pool.query(bytes(DNSUtils.question(name).pack()))
+    return DNSUtils.parse(response) if response is not None else None
+
+
+class UpstreamPoolTest(unittest.TestCase):
+
+    def test_answer_and_rtt_sample(self):
+        with StubServer(answer) as stub:
+            pool = UpstreamPool([stub.address], 0.5)
+            self.assertEqual(str(query(pool).rr[0].rdata), '192.0.2.1')
+            self.assertIsNotNone(pool.rtt[stub.address].srtt)
+
+    def test_host_name_upstream(self):
+        if socket.getaddrinfo('localhost', 53, type=socket.SOCK_DGRAM)[0][0] != socket.AF_INET:
+            self.skipTest('localhost does not resolve to IPv4 first')
+        with StubServer(answer) as stub:
+            pool = UpstreamPool([('localhost', stub.address[1])], 0.5, hedge=False)
+            self.assertEqual(str(query(pool).rr[0].rdata), '192.0.2.1')
+
+    def test_ipv6_upstream(self):
+        try:
+            stub = StubServer(answer, ('::1', 0))
+        except OSError:
+            self.skipTest('no IPv6 loopback')
+        with stub:
+            pool = UpstreamPool([stub.address[:2]], 0.5)
+            self.assertEqual(str(query(pool).rr[0].rdata), '192.0.2.1')
+
+    def test_retransmit_gives_no_rtt_sample(self):
+        with StubServer(DropFirst()) as stub:
+            pool = UpstreamPool([stub.address], 0.1, hedge=False)
+            self.assertEqual(str(query(pool).rr[0].rdata), '192.0.2.1')
+            self.assertEqual(len(stub.queries), 2)
+            # the reply may answer either send, Karn's rule skips the sample
+            self.assertIsNone(pool.rtt[stub.address].srtt)
+
+    def test_hedged_winner_demotes_the_slow_upstream(self):
+        with StubServer(slow) as primary, StubServer(answer) as secondary:
+            pool = UpstreamPool([primary.address, secondary.address], 0.5)
+            # both used to be fast, the primary has just become slow
+            for _ in range(8):
+                pool.rtt[primary.address].update(0.001)
+                pool.rtt[secondary.address].update(0.05)
+            self.assertEqual(pool.ranked()[0], primary.address)
+            for _ in range(8):
+                start = time.monotonic()
+                self.assertEqual(str(query(pool).rr[0].rdata), '192.0.2.1')
+                # the hedge answered, nobody waited for the slow server
+                self.assertLess(time.monotonic() - start, 0.25)
+                if pool.ranked()[0] == secondary.address:
+                    break
+            self.assertEqual(pool.ranked()[0], secondary.address)
+            for _ in range(3):
+                query(pool)
+            self.assertEqual(pool.ranked()[0], secondary.address)
+
+    def test_no_answer(self):
+        with StubServer(lambda request, data: None) as stub:
+            pool = UpstreamPool([stub.address], 0.05, hedge=False)
+            self.assertIsNone(query(pool))
+
+
+if __name__ == '__main__':
+    unittest.main()
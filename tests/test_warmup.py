@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from cache import Cache, ShardedCache, get_chain
+from conf import Config
+from dnsUtils import RR, A, QTYPE
+from stages import open_cache
+from upstream import UpstreamPool
+from warmup import warm
+from stubs import StubServer
+
+
+def answer(request, data):
+    reply = request.reply(aa=0)
+    if str(request.q.qname).startswith('gone'):
+        reply.header.rcode = 3
+        return reply
+    reply.add_answer(RR(request.q.qname, QTYPE.A, 1, 300, A('192.0.2.1')),
+                     RR('planted.test', QTYPE.A, 1, 300, A('203.0.113.6')))
+    return reply
+
+
+class WarmupTest(unittest.TestCase):
+
+    def test_warm_fills_the_cache(self):
+        cache = ShardedCache(4)
+        names = [('w%d.test' % i, 'A') for i in range(40)] + [('gone.test', 'A')]
+        with StubServer(answer) as stub:
+            pool = UpstreamPool([stub.address], 0.5)
+            ready = warm(cache, names, lambda request, data: pool.query(data),
+                         concurrency=8, rate=1000)
+        self.assertAlmostEqual(ready, 40 / 41)
+        self.assertIsNone(get_chain(cache, ('w7.test.', 'A'))[1])
+        self.assertIsNotNone(get_chain(cache, ('planted.test.', 'A'))[1])
+
+    def test_bad_names_are_skipped(self):
+        cache = ShardedCache(4)
+        names = [('x' * 64 + '.test', 'A'), ('ok.test', 'BOGUS'), ('ok.test', 'A')]
+        with StubServer(answer) as stub:
+            pool = UpstreamPool([stub.address], 0.5)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                ready = warm(cache, names, lambda request, data: pool.query(data),
+                             rate=1000, report=0)
+        self.assertAlmostEqual(ready, 1 / 3)
+        # every name, bad or not, reaches the progress report
+        progress = [line for line in output.getvalue().splitlines() if 'resolved' in line]
+        self.assertEqual(len(progress), 3)
+        self.assertIn('3/3 resolved, 1 cached', progress[-1])
+
+    def test_warm_up_uses_the_locked_cache(self):
+        config = Config()
+        config.cache_dump = os.path.join(tempfile.mkdtemp(), 'missing.cache')
+        self.assertIsInstance(open_cache(config), Cache)
+        config.warmup = 'names.txt'
+        self.assertIsInstance(open_cache(config), ShardedCache)
+        # purge and snapshot run on the control server's threads
+        config.warmup = None
+        config.control_socket = os.path.join(tempfile.mkdtemp(), 'dns.ctl')
+        self.assertIsInstance(open_cache(config), ShardedCache)
+
+
+if __name__ == '__main__':
+    unittest.main()
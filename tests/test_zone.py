@@ -0,0 +1,82 @@
+import unittest
+
+from dnsUtils import DNSUtils, QTYPE, RCODE
+from zone import ZoneStore
+
+ZONE = """$TTL 300
+@       IN SOA  ns1 host 1 3600 600 86400 60
+@       IN NS   ns1
+ns1     IN A    192.0.2.1
+www     IN CNAME ns1
+loop1   IN CNAME loop2
+loop2   IN CNAME loop1
+dangling IN CNAME missing
+out     IN CNAME www.example.com.
+@       IN MX   10 mail
+mail    IN A    192.0.2.25
+@       IN TXT  "v=spf1 mx -all" "second"
+_sip._tcp IN SRV 0 5 5060 ns1
+odd     IN TYPE65280 \\# 2 abcd
+bad     IN WKS  192.0.2.1 TCP ftp
+"""
+
+
+class ZoneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.zones = ZoneStore()
+        self.zones.load_zone(ZONE, 'corp.internal.')
+
+    def ask(self, name, qtype='A', id=4321):
+        request = DNSUtils.question(name, qtype)
+        request.header.id = id
+        request.header.rd = 1
+        return DNSUtils.parse(self.zones.answer(request, bytes(request.pack())))
+
+    def test_positive_answer_echoes_query(self):
+        response = self.ask('NS1.corp.internal')
+        self.assertEqual((response.header.id, response.header.rd, response.header.aa), (4321, 1, 1))
+        self.assertEqual(str(response.q.qname), 'NS1.corp.internal.')
+        self.assertEqual([str(rr.rdata) for rr in response.rr], ['192.0.2.1'])
+
+    def test_cname_is_followed_in_zone(self):
+        response = self.ask('www.corp.internal')
+        self.assertEqual(response.header.rcode, RCODE.NOERROR)
+        self.assertEqual([QTYPE.get(rr.rtype) for rr in response.rr], ['CNAME', 'A'])
+        self.assertEqual(str(response.rr[1].rdata), '192.0.2.1')
+
+    def test_cname_out_of_zone(self):
+        response = self.ask('out.corp.internal')
+        self.assertEqual([QTYPE.get(rr.rtype) for rr in response.rr], ['CNAME'])
+        self.assertFalse(response.auth)
+
+    def test_dangling_cname_and_loop(self):
+        response = self.ask('dangling.corp.internal')
+        self.assertEqual(response.header.rcode, RCODE.NXDOMAIN)
+        self.assertEqual(len(response.rr), 1)
+        response = self.ask('loop1.corp.internal')
+        self.assertEqual(response.header.rcode, RCODE.NOERROR)
+        self.assertTrue(response.auth)
+
+    def test_mx_txt_srv(self):
+        mx = self.ask('corp.internal', 'MX').rr[0].rdata
+        self.assertEqual((mx.preference, str(mx.label)), (10, 'mail.corp.internal.'))
+        txt = self.ask('corp.internal', 'TXT').rr[0].rdata
+        self.assertEqual(txt.data, [b'v=spf1 mx -all', b'second'])
+        srv = self.ask('_sip._tcp.corp.internal', 'SRV').rr[0].rdata
+        self.assertEqual((srv.port, str(srv.target)), (5060, 'ns1.corp.internal.'))
+
+    def test_unsupported_record_is_skipped(self):
+        self.assertEqual(self.ask('bad.corp.internal').header.rcode, RCODE.NXDOMAIN)
+        self.assertEqual(self.ask('mail.corp.internal').header.rcode, RCODE.NOERROR)
+        self.assertIn('odd.corp.internal.', [str(name) for name in self.zones._names])
+
+    def test_negative_answers(self):
+        self.assertEqual(self.ask('nope.corp.internal').header.rcode, RCODE.NXDOMAIN)
+        response = self.ask('ns1.corp.internal', 'AAAA')
+        self.assertEqual((response.header.rcode, len(response.rr)), (RCODE.NOERROR, 0))
+        self.assertIsNone(self.zones.answer(DNSUtils.question('example.com'), b''))
+
+
+if __name__ == '__main__':
+    unittest.main()
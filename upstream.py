@@ -0,0 +1,327 @@
+import random
+import select
+import socket
+import ssl
+import struct
+import threading
+from collections import deque
+from threading import Lock
+from time import monotonic
+
+
+class RttEstimator:
+    """
+        Smoothed RTT and retransmission timeout as in RFC 6298 (TCP),
+        plus a window of recent samples for the p95 hedge delay
+    """
+
+    def __init__(self, initial=0.5, min_rto=0.05, max_rto=4.0, window=64):
+        self.srtt = None
+        self.rttvar = None
+        self.initial = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.backoff = 1
+        self.samples = deque(maxlen=window)
+        self._lock = Lock()
+
+    def update(self, rtt: float):
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            self.backoff = 1
+            self.samples.append(rtt)
+
+    def timed_out(self):
+        with self._lock:
+            self.backoff = min(self.backoff * 2, 64)
+
+    def lost(self, elapsed: float):
+        """
+            Another upstream answered first while this one had been waiting
+            `elapsed` seconds. That is a lower bound on its RTT: if it is
+            above the SRTT, take it as a sample and back off as on a timeout,
+            so a server that became slow stops being ranked first.
+        """
+        with self._lock:
+            if self.srtt is not None and elapsed <= self.srtt:
+                return
+            if self.srtt is None:
+                self.srtt = elapsed
+                self.rttvar = elapsed / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * (elapsed - self.srtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * elapsed
+            self.samples.append(elapsed)
+            self.backoff = min(self.backoff * 2, 64)
+
+    @property
+    def rto(self) -> float:
+        if self.srtt is None:
+            rto = self.initial
+        else:
+            rto = self.srtt + max(0.01, 4 * self.rttvar)
+        return min(self.max_rto, max(self.min_rto, rto * self.backoff))
+
+    @property
+    def p95(self) -> float:
+        samples = sorted(self.samples)
+        if len(samples) < 8:
+            return self.rto
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+class UpstreamPool:
+    """
+        Forward queries to a set of upstreams, fastest (lowest SRTT) first.
+        If hedging is on and the first upstream has not answered by its
+        p95 RTT, the query is also sent to the next one and the first
+        matching answer wins. Unanswered queries are retried on the next
+        upstream after the RTO. Host names are resolved once, here; IPv4
+        and IPv6 upstreams may be mixed.
+    """
+
+    def __init__(self, addresses, timeout=0.5, hedge=True, retries=1, buffer_size=4096):
+        # replies are matched on the address recvfrom reports, so keep
+        # the resolved socket address of each upstream
+        self.families = {}
+        for host, port in addresses:
+            family, _, _, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+            self.families[sockaddr] = family
+        self.addresses = list(self.families)
+        self.hedge = hedge
+        self.retries = retries
+        self.buffer_size = buffer_size
+        self.rtt = {address: RttEstimator(timeout) for address in self.addresses}
+
+    def ranked(self):
+        return sorted(self.addresses, key=lambda a: self.rtt[a].rto)
+
+    def query(self, data: bytes):
+        """
+            Return the first upstream response to data, or None
+        """
+        order = self.ranked()
+        # address -> time of the first send; an upstream sent the query
+        # twice gives no RTT sample, the reply may be to either (Karn)
+        pending = {}
+        retransmitted = set()
+        sockets = {}
+        try:
+            def send(address):
+                family = self.families[address]
+                if family not in sockets:
+                    sockets[family] = socket.socket(family, socket.SOCK_DGRAM)
+                sockets[family].sendto(data, address)
+                now = monotonic()
+                if address in pending:
+                    retransmitted.add(address)
+                else:
+                    pending[address] = now
+                return now
+
+            sent = send(order[0])
+            sends = 1
+            attempts = 1 + self.retries
+            deadline = sent + self.rtt[order[0]].rto
+            hedge_at = sent + self.rtt[order[0]].p95 \
+                if self.hedge and len(order) > 1 else None
+            while True:
+                now = monotonic()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    sent = send(order[1])
+                    sends += 1
+                    deadline = max(deadline, sent + self.rtt[order[1]].rto)
+                    attempts -= 1
+                if now >= deadline:
+                    for address in pending:
+                        self.rtt[address].timed_out()
+                    attempts -= 1
+                    if attempts <= 0:
+                        return None
+                    address = order[sends % len(order)]
+                    sent = send(address)
+                    sends += 1
+                    deadline = sent + self.rtt[address].rto
+                    continue
+                wait = min(deadline, hedge_at or deadline) - now
+                readable, _, _ = select.select(list(sockets.values()), [], [], wait)
+                for sock in readable:
+                    response, address = sock.recvfrom(self.buffer_size)
+                    if address in pending and response[:2] == data[:2]:
+                        now = monotonic()
+                        if address not in retransmitted:
+                            self.rtt[address].update(now - pending[address])
+                        for loser, first in pending.items():
+                            if loser != address:
+                                self.rtt[loser].lost(now - first)
+                        return response
+        except OSError:
+            return None
+        finally:
+            for sock in sockets.values():
+                sock.close()
+
+
+class StreamConnection:
+    """
+        One long-lived TCP or TLS connection carrying many queries at once.
+        Every query is sent under an ID unique on this connection and a
+        reader thread hands each response to the query waiting for it, so
+        answers may arrive in any order.
+    """
+
+    def __init__(self, address, context=None, server_name=None, session=None, timeout=2.0):
+        sock = socket.create_connection(address, timeout)
+        if context is not None:
+            sock = context.wrap_socket(sock, server_hostname=server_name, session=session)
+        sock.settimeout(None)
+        self.sock = sock
+        self.alive = True
+        self.resumed = getattr(sock, 'session_reused', False)
+        self._ticket = None
+        self._file = sock.makefile('rb')
+        self._send_lock = Lock()
+        self._lock = Lock()
+        # wire id -> [event, response]
+        self._pending = {}
+        self._next_id = random.randrange(65536)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    @property
+    def session(self):
+        return self._ticket or getattr(self.sock, 'session', None)
+
+    def _allocate(self, slot):
+        with self._lock:
+            if len(self._pending) >= 65536:
+                return None
+            while self._next_id in self._pending:
+                self._next_id = (self._next_id + 1) & 0xffff
+            wire_id = self._next_id
+            self._next_id = (wire_id + 1) & 0xffff
+            self._pending[wire_id] = slot
+            return wire_id
+
+    def query(self, data: bytes, timeout: float):
+        """
+            Return the response to data (with its own ID), or None
+        """
+        slot = [threading.Event(), None]
+        wire_id = self._allocate(slot)
+        if wire_id is None:
+            return None
+        try:
+            with self._send_lock:
+                self.sock.sendall(struct.pack('!HH', len(data), wire_id) + data[2:])
+            if not slot[0].wait(timeout) or slot[1] is None:
+                return None
+            return data[:2] + slot[1][2:]
+        except OSError:
+            self.close()
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(wire_id, None)
+
+    def _read(self):
+        try:
+            while True:
+                header = self._file.read(2)
+                if len(header) < 2:
+                    break
+                length, = struct.unpack('!H', header)
+                response = self._file.read(length)
+                if len(response) < length or length < 2:
+                    break
+                with self._lock:
+                    slot = self._pending.get(struct.unpack('!H', response[:2])[0])
+                if slot is not None:
+                    slot[1] = response
+                    slot[0].set()
+                if self._ticket is None:
+                    # TLS 1.3 tickets arrive after the handshake, keep the
+                    # session once data flows so it outlives the socket
+                    self._ticket = getattr(self.sock, 'session', None)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if not self.alive:
+                return
+            self.alive = False
+            pending = list(self._pending.values())
+        for slot in pending:
+            slot[0].set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class StreamPool:
+    """
+        A few persistent stream connections to one upstream (plain TCP,
+        or DNS over TLS with session resumption), used round-robin.
+        Dead connections are replaced on the next query and a query that
+        lost its connection is retried on the next one.
+    """
+
+    def __init__(self, address, connections=2, tls=False, server_name=None, cafile=None, timeout=2.0):
+        self.address = tuple(address)
+        self.size = connections
+        self.timeout = timeout
+        self.server_name = server_name or self.address[0]
+        self.context = ssl.create_default_context(cafile=cafile) if tls else None
+        self.connects = 0
+        self.resumed = 0
+        self._connections = [None] * connections
+        self._session = None
+        self._turn = 0
+        self._lock = Lock()
+
+    def _connection(self):
+        with self._lock:
+            self._turn = (self._turn + 1) % self.size
+            connection = self._connections[self._turn]
+            if connection is not None and connection.alive:
+                return connection
+            if connection is not None and self.context is not None:
+                self._session = connection.session or self._session
+            connection = StreamConnection(self.address, self.context, self.server_name,
+                                          self._session, self.timeout)
+            self.connects += 1
+            self.resumed += connection.resumed
+            if self.context is not None and self._session is None:
+                self._session = connection.session
+            self._connections[self._turn] = connection
+            return connection
+
+    def query(self, data: bytes):
+        """
+            Return the upstream response to data, or None
+        """
+        for _ in range(self.size + 1):
+            try:
+                connection = self._connection()
+            except (OSError, ssl.SSLError):
+                return None
+            response = connection.query(data, self.timeout)
+            if response is not None or connection.alive:
+                return response
+        return None
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                if connection is not None:
+                    connection.close()
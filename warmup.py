@@ -0,0 +1,102 @@
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+from dnsUtils import DNSUtils
+from cache import store_rrsets
+from sketch import TopK
+
+
+def read_names(filename: str):
+    """
+        Read "name [type]" lines, type defaults to A; # starts a comment
+    """
+    names = []
+    with open(filename) as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if fields:
+                names.append((fields[0], fields[1].upper() if len(fields) > 1 else 'A'))
+    return names
+
+
+def top_names(filenames, n=10000):
+    """
+        Most queried (name, type) keys of query log files, in constant
+        memory
+    """
+    # twice the counters keeps one-off names out of the reported top n
+    top = TopK(2 * n)
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                event = json.loads(line)
+                if event['e'] in ('hit', 'miss'):
+                    top.add((event['n'], event['q']))
+    return [key for key, _, _ in top.top(n)]
+
+
+def warm(cache, names, resolve, concurrency=32, rate=200, report=5.0):
+    """
+        Resolve names into cache with up to `concurrency` queries in
+        flight, started at no more than `rate` per second. resolve(request,
+        data) returns the upstream response bytes or None. Prints progress
+        every `report` seconds; returns the share of names now cached.
+    """
+    names = list(names)
+    if not names:
+        return 0.0
+    counts = {'done': 0, 'cached': 0}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+    start = last = monotonic()
+
+    def fetch(name, qtype):
+        try:
+            request = DNSUtils.question(name, qtype)
+            response = resolve(request, bytes(request.pack()))
+            if response is None:
+                return False
+            parsed = DNSUtils.parse(response)
+            if parsed.header.rcode == 0 and parsed.rr:
+                store_rrsets(cache, request.q.qname, request.q.qtype, parsed.rr)
+                return True
+            return False
+        except Exception:
+            # a bad line (a label over 63 bytes, an unknown type) or a
+            # failing resolver only costs its own name, the progress
+            # count still moves on
+            return False
+        finally:
+            slots.release()
+
+    def finished(future):
+        nonlocal last
+        with lock:
+            counts['done'] += 1
+            counts['cached'] += future.result()
+            now = monotonic()
+            if now - last >= report:
+                last = now
+                print(f'Warm-up: {counts["done"]}/{len(names)} resolved, {counts["cached"]} cached.')
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for i, (name, qtype) in enumerate(names):
+            # pace the starts, the upstream sees at most `rate` queries/s
+            delay = start + i / rate - monotonic()
+            if delay > 0:
+                sleep(delay)
+            slots.acquire()
+            executor.submit(fetch, name, qtype).add_done_callback(finished)
+    ready = counts['cached'] / len(names)
+    print(f'Warm-up done: {counts["cached"]}/{len(names)} names cached '
+          f'({ready:.0%} ready) in {monotonic() - start:.1f}s.')
+    return ready
+
+
+if __name__ == '__main__':
+    # python warmup.py 10000 queries.log.1 queries.log > top.txt
+    for name, qtype in top_names(sys.argv[2:], int(sys.argv[1])):
+        print(name, qtype)
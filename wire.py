@@ -0,0 +1,33 @@
+import struct
+
+
+def question_end(data: bytes) -> int:
+    """
+        Offset just past the first question (qname, qtype, qclass)
+    """
+    end = 12
+    while data[end]:
+        end += data[end] + 1
+    return end + 5
+
+
+def reply(data: bytes, rcode: int, answers=(), ttl=60) -> bytes:
+    """
+        Build a response to the query in data with the given rcode and
+        (rtype, rdata) answers owned by the question name
+    """
+    end = question_end(data)
+    flags = 0x8080 | (data[2] & 0x01) << 8 | rcode
+    header = data[0:2] + struct.pack("!HHHHH", flags, 1, len(answers), 0, 0)
+    rr = b''.join(struct.pack("!HHHIH", 0xc00c, rtype, 1, ttl, len(rdata)) + rdata
+                  for rtype, rdata in answers)
+    return header + data[12:end] + rr
+
+
+def truncated(data: bytes) -> bytes:
+    """
+        Empty response with TC set, the client retries over TCP
+    """
+    end = question_end(data)
+    flags = 0x8280 | (data[2] & 0x01) << 8
+    return data[0:2] + struct.pack("!HHHHH", flags, 1, 0, 0, 0) + data[12:end]
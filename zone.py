@@ -0,0 +1,118 @@
+import struct
+
+from dnslib.label import DNSLabel
+from dnsUtils import DNSUtils, DNSHeader, DNSQuestion, QTYPE, CLASS, RCODE, ZoneParser
+from wire import question_end
+from cache import MAX_CHAIN
+
+
+class ZoneStore:
+    """
+        Authoritative data for the configured zones.
+        Records are indexed by (name, qtype) and the positive answers are
+        compiled to pack plans at load time, so serving them is a copy and
+        an id, flags and question patch.
+    """
+
+    def __init__(self):
+        self._soa = {}
+        self._records = {}
+        self._names = set()
+        self._plans = {}
+
+    @classmethod
+    def from_config(cls, config) -> 'ZoneStore':
+        zones = cls()
+        for origin, filename in config.zones.items():
+            zones.load(filename, origin)
+        return zones
+
+    def load(self, filename: str, origin: str):
+        with open(filename) as f:
+            self.load_zone(f.read(), origin)
+        print(f'Zone {origin} loaded from {filename}.')
+
+    def load_zone(self, zone: str, origin: str):
+        apex = DNSLabel(origin)
+        records = {}
+        # a record we cannot parse is skipped, not the whole zone
+        parser = ZoneParser(zone, origin=apex, strict=False)
+        for rr in parser:
+            if rr.rtype == QTYPE.SOA:
+                apex = rr.rname
+            records.setdefault((rr.rname, rr.rtype), []).append(rr)
+        for tokens, error in parser.skipped:
+            print(f'Zone {apex}: skipped record {" ".join(tokens)}: {error}')
+        soa = records.get((apex, QTYPE.SOA))
+        if not soa:
+            raise ValueError("Zone %s has no SOA record" % apex)
+        self._soa[apex] = soa[0]
+        for (name, rtype), rrs in records.items():
+            self._records[(name, rtype)] = rrs
+            self._names.add(name)
+            self._plans[(name, rtype)] = self._compile(
+                DNSQuestion(name, rtype), RCODE.NOERROR, rrs, [])
+
+    def find_zone(self, qname: DNSLabel):
+        """
+            Longest suffix match of qname against the zone apexes
+        """
+        labels = qname.label
+        for i in range(len(labels) + 1):
+            apex = DNSLabel(labels[i:])
+            if apex in self._soa:
+                return apex
+        return None
+
+    def answer(self, request: DNSUtils, data: bytes):
+        """
+            Return a packed authoritative reply or None if the name is not
+            in any local zone
+        """
+        q = request.q
+        if q.qclass != CLASS.IN:
+            return None
+        apex = self.find_zone(q.qname)
+        if apex is None:
+            return None
+        plan = self._plans.get((q.qname, q.qtype))
+        if plan is None:
+            plan = self._compile(q, *self._follow(apex, q.qname, q.qtype))
+        return self._patch(plan, data)
+
+    def _follow(self, apex, name, qtype):
+        """
+            rcode, answer and authority for a name without qtype data:
+            its CNAME chain while the targets stay in the zone, then the
+            target's records, or the SOA when there are none
+        """
+        answer = []
+        for _ in range(MAX_CHAIN):
+            records = self._records.get((name, qtype))
+            if records is not None:
+                return RCODE.NOERROR, answer + records, []
+            cname = self._records.get((name, QTYPE.CNAME))
+            if cname is None:
+                break
+            answer += cname
+            name = cname[0].rdata.label
+            if self.find_zone(name) != apex:
+                # the client resolves the out of zone target itself
+                return RCODE.NOERROR, answer, []
+        rcode = RCODE.NOERROR if name in self._names else RCODE.NXDOMAIN
+        return rcode, answer, [self._soa[apex]]
+
+    @staticmethod
+    def _compile(q, rcode, rr, auth):
+        reply = DNSUtils(DNSHeader(id=0, qr=1, aa=1, ra=1, rcode=rcode),
+                         q=DNSQuestion(q.qname, q.qtype, q.qclass),
+                         rr=rr, auth=auth)
+        return reply.compile()
+
+    @staticmethod
+    def _patch(plan, data: bytes):
+        # Take id and RD from the query and echo its question verbatim
+        # so the client sees the qname case it sent
+        id, flags = struct.unpack_from("!HH", data)
+        return plan.pack(id=id, flags=(plan.flags & 0xfeff) | (flags & 0x0100),
+                         question=data[12:question_end(data)])